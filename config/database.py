@@ -1,17 +1,173 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ReadPreference, ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime, timedelta
 import certifi
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI")
-client = MongoClient(MONGO_URI, tlsCAFile=certifi.where())
+client = MongoClient(
+    MONGO_URI,
+    tlsCAFile=certifi.where(),
+    maxPoolSize=int(os.getenv("MONGO_MAX_POOL_SIZE", 100)),
+)
 db = client.get_default_database()
 
+# Separate client for heavy reports so they can't use up the booking path's
+# connections. Reads prefer a secondary; point ANALYTICS_MONGO_URI at a specific
+# replica set member (directConnection=true) to pin reports there. For a local
+# replica set without TLS, set ANALYTICS_MONGO_TLS=false.
+ANALYTICS_MONGO_URI = os.getenv("ANALYTICS_MONGO_URI", MONGO_URI)
+ANALYTICS_MAX_TIME_MS = int(os.getenv("ANALYTICS_MAX_TIME_MS", 15000))
+analytics_client = MongoClient(
+    ANALYTICS_MONGO_URI,
+    maxPoolSize=int(os.getenv("ANALYTICS_MAX_POOL_SIZE", 10)),
+    readPreference="secondaryPreferred",
+    **({"tlsCAFile": certifi.where()} if os.getenv("ANALYTICS_MONGO_TLS", "true").lower() != "false" else {}),
+)
+analytics_db = analytics_client.get_database(
+    db.name, read_preference=ReadPreference.SECONDARY_PREFERRED
+)
+
 # Define collections
 drivers_collection = db["drivers"]
 appointments_collection = db["appointments"]
 spents_collection = db["spents"]
 payments_collection = db["payments"]
-deleted_spents_collection = db["deleted_spents"]
\ No newline at end of file
+deleted_spents_collection = db["deleted_spents"]
+deleted_payments_collection = db["deleted_payments"]
+customers_collection = db["customers"]
+employee_ledgers_collection = db["employee_ledgers"]
+room_occupancy_collection = db["room_occupancy"]
+idempotency_keys_collection = db["idempotency_keys"]
+migrations_collection = db["migrations"]
+
+# Read-only handles for reports
+analytics_appointments_collection = analytics_db["appointments"]
+analytics_spents_collection = analytics_db["spents"]
+analytics_employee_ledgers_collection = analytics_db["employee_ledgers"]
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", 24 * 60 * 60))
+
+# A running migration refreshes its marker this often; one not refreshed for
+# MIGRATION_STALE_AFTER is assumed to have died and is taken over
+MIGRATION_HEARTBEAT_SECONDS = 15
+MIGRATION_STALE_AFTER = timedelta(seconds=int(os.getenv("MIGRATION_STALE_SECONDS", 90)))
+
+
+def ensure_indexes():
+    # One customer document per company + normalized phone
+    customers_collection.create_index(
+        [("company_id", ASCENDING), ("phone", ASCENDING)], unique=True
+    )
+    customers_collection.create_index(
+        [("company_id", ASCENDING), ("last_visit", DESCENDING)]
+    )
+    # One running ledger per employee
+    employee_ledgers_collection.create_index(
+        [("company_id", ASCENDING), ("employee_name", ASCENDING)], unique=True
+    )
+    payments_collection.create_index(
+        [("company_id", ASCENDING), ("paid_date", DESCENDING)]
+    )
+    # One slot bitmap per company, day and room
+    room_occupancy_collection.create_index(
+        [("company_id", ASCENDING), ("day", ASCENDING), ("room", ASCENDING)], unique=True
+    )
+    appointments_collection.create_index(
+        [("company_id", ASCENDING), ("room", ASCENDING), ("event_start_datetime", ASCENDING)]
+    )
+    # A customer's first/last visit, by normalized phone
+    appointments_collection.create_index(
+        [("company_id", ASCENDING), ("phone_key", ASCENDING), ("event_start_datetime", ASCENDING)]
+    )
+    # Date-range reads for the financial summary
+    appointments_collection.create_index(
+        [("company_id", ASCENDING), ("event_start_datetime", ASCENDING)]
+    )
+    spents_collection.create_index(
+        [("company_id", ASCENDING), ("bought_date", ASCENDING)]
+    )
+    spents_collection.create_index(
+        [("company_id", ASCENDING), ("salary_given_date", ASCENDING)]
+    )
+    # Delta sync range scans
+    for collection in (
+        appointments_collection, spents_collection, payments_collection,
+        deleted_spents_collection, deleted_payments_collection
+    ):
+        collection.create_index([("company_id", ASCENDING), ("updated_at", ASCENDING)])
+    # Stored responses for Idempotency-Key replays expire on their own
+    idempotency_keys_collection.create_index(
+        "created_at", expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS
+    )
+
+
+def _claim_migration(name: str):
+    """
+    Tries to become the worker that runs this migration.
+    Returns None if claimed, otherwise the existing marker.
+    """
+    now = datetime.now()
+    try:
+        migrations_collection.insert_one({"_id": name, "status": "running", "started_at": now, "heartbeat_at": now})
+        return None
+    except DuplicateKeyError:
+        pass
+    # Take over from a worker that was killed partway
+    cutoff = now - MIGRATION_STALE_AFTER
+    stale = migrations_collection.find_one_and_update(
+        {"_id": name, "status": "running", "$or": [
+            {"heartbeat_at": {"$lt": cutoff}},
+            {"heartbeat_at": {"$exists": False}, "started_at": {"$lt": cutoff}},
+        ]},
+        {"$set": {"started_at": now, "heartbeat_at": now}},
+    )
+    if stale:
+        return None
+    # {} if the marker was just removed by a failed run: try to claim again
+    return migrations_collection.find_one({"_id": name}) or {}
+
+
+def run_once(name: str, func):
+    """
+    Runs func the first time any worker starts with this name, recording a
+    marker in the migrations collection so it never runs again. Other workers
+    wait until it is done. The marker carries a heartbeat, so a run killed
+    partway is picked up again; if func fails, the marker is removed and the
+    next worker retries.
+    """
+    while True:
+        marker = _claim_migration(name)
+        if marker is None:
+            break
+        if marker.get("status") == "done":
+            return
+        if marker:
+            time.sleep(MIGRATION_HEARTBEAT_SECONDS)
+
+    stop = threading.Event()
+
+    def heartbeat():
+        while not stop.wait(MIGRATION_HEARTBEAT_SECONDS):
+            migrations_collection.update_one(
+                {"_id": name, "status": "running"},
+                {"$set": {"heartbeat_at": datetime.now()}}
+            )
+
+    threading.Thread(target=heartbeat, daemon=True, name=f"migration-{name}").start()
+    try:
+        result = func()
+    except Exception:
+        migrations_collection.delete_one({"_id": name})
+        raise
+    finally:
+        stop.set()
+    migrations_collection.update_one(
+        {"_id": name},
+        {"$set": {"status": "done", "finished_at": datetime.now(), "result": result}}
+    )
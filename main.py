@@ -1,13 +1,60 @@
-from fastapi import FastAPI
-from routes import auth, appointment, spent, payment
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from pymongo.errors import ExecutionTimeout
+from routes import auth, appointment, spent, payment, customer, sync, dashboard
+from config.database import ensure_indexes, run_once
+from models.ledger import backfill_ledgers
+from models.occupancy import backfill_occupancy
+from models.customer import backfill_phone_keys
+from utils import coalesce_stats
+from middleware import IdempotencyMiddleware, RateLimitMiddleware
+from ratelimit import rate_limit_stats
+from models.notification import messaging_status
 
 app = FastAPI()
+app.add_middleware(IdempotencyMiddleware)
+# Added last so it runs first: rejected requests never reach the database
+app.add_middleware(RateLimitMiddleware)
 
 app.include_router(auth.router, prefix="/auth", tags=["Auth"])
 app.include_router(appointment.router, prefix="/appointments", tags=["Appointments"])
 app.include_router(spent.router, prefix="/spents", tags=["Spents"])
 app.include_router(payment.router, prefix="/payments", tags=["Payments"])
+app.include_router(customer.router, prefix="/customers", tags=["Customers"])
+app.include_router(sync.router, prefix="/sync", tags=["Sync"])
+app.include_router(dashboard.router, prefix="/dashboard", tags=["Dashboard"])
+
+@app.exception_handler(ExecutionTimeout)
+async def report_timeout(request: Request, exc: ExecutionTimeout):
+    # A report hit ANALYTICS_MAX_TIME_MS; tell the client to come back later
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Report is taking too long, please try again shortly"},
+        headers={"Retry-After": "30"},
+    )
+
+@app.on_event("startup")
+def create_indexes():
+    ensure_indexes()
+    # Ledgers must hold the salary history before add_spent relies on them
+    run_once("backfill_ledgers", backfill_ledgers)
+    # Slot and free-room lookups read only the bitmaps
+    run_once("backfill_occupancy", backfill_occupancy)
+    # Customer visit dates are recomputed from appointments by phone_key
+    run_once("backfill_phone_keys", backfill_phone_keys)
 
 @app.get("/")
 def read_root():
     return {"message": "Party App API running"}
+
+@app.get("/metrics/coalescing")
+def coalescing_metrics():
+    return {"coalescing": coalesce_stats}
+
+@app.get("/metrics/rate-limits")
+def rate_limit_metrics():
+    return {"rate_limits": rate_limit_stats}
+
+@app.get("/metrics/messaging")
+def messaging_metrics():
+    return {"messaging": messaging_status()}
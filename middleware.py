@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import re
+from datetime import datetime, timedelta
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from pymongo.errors import DuplicateKeyError
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.concurrency import run_in_threadpool
+from config.database import idempotency_keys_collection
+from ratelimit import rate_limiter, route_class
+
+# POST endpoints the mobile app retries on flaky networks
+IDEMPOTENT_PATHS = {
+    "/appointments/",
+    "/spents/",
+    "/auth/register",
+    "/auth/create-company",
+    "/auth/create-employee",
+}
+# A request still "in progress" after this long is assumed to have died
+IN_PROGRESS_TIMEOUT = timedelta(seconds=120)
+
+
+def _claim(record_id: str, fingerprint: str):
+    """
+    Tries to become the request that does the work for this key.
+    Returns None if claimed, otherwise the existing record.
+    """
+    now = datetime.now()
+    try:
+        idempotency_keys_collection.insert_one({
+            "_id": record_id,
+            "fingerprint": fingerprint,
+            "status": "in_progress",
+            "created_at": now,
+        })
+        return None
+    except DuplicateKeyError:
+        pass
+    # Take over from a request that never finished
+    stale = idempotency_keys_collection.find_one_and_update(
+        {"_id": record_id, "status": "in_progress", "created_at": {"$lt": now - IN_PROGRESS_TIMEOUT}},
+        {"$set": {"fingerprint": fingerprint, "created_at": now}},
+    )
+    if stale:
+        return None
+    return idempotency_keys_collection.find_one({"_id": record_id})
+
+
+def _store(record_id: str, status_code: int, body: bytes, media_type: str):
+    idempotency_keys_collection.update_one(
+        {"_id": record_id},
+        {"$set": {
+            "status": "completed",
+            "status_code": status_code,
+            "body": body,
+            "media_type": media_type,
+        }},
+    )
+
+
+def _release(record_id: str):
+    idempotency_keys_collection.delete_one({"_id": record_id, "status": "in_progress"})
+
+
+class IdempotencyMiddleware(BaseHTTPMiddleware):
+    """
+    Makes the POSTs in IDEMPOTENT_PATHS safe to retry. When the client sends an
+    Idempotency-Key header, the first response for that key is stored and
+    replayed for any retry, without running validation, inserts or
+    notifications again. Server errors are not stored, so those can be retried.
+    """
+
+    async def dispatch(self, request: Request, call_next):
+        key = request.headers.get("Idempotency-Key")
+        if request.method != "POST" or not key or request.url.path not in IDEMPOTENT_PATHS:
+            return await call_next(request)
+
+        body = await request.body()
+        fingerprint = hashlib.sha256(body).hexdigest()
+        record_id = f"{request.url.path}:{key}"
+
+        existing = await run_in_threadpool(_claim, record_id, fingerprint)
+        if existing is not None:
+            if existing.get("fingerprint") != fingerprint:
+                return JSONResponse(
+                    status_code=422,
+                    content={"detail": "Idempotency-Key was already used with a different request body"},
+                )
+            if existing.get("status") != "completed":
+                return JSONResponse(
+                    status_code=409,
+                    content={"detail": "A request with this Idempotency-Key is still in progress"},
+                    headers={"Retry-After": "1"},
+                )
+            return Response(
+                content=existing["body"],
+                status_code=existing["status_code"],
+                media_type=existing.get("media_type"),
+                headers={"Idempotent-Replayed": "true"},
+            )
+
+        try:
+            response = await call_next(request)
+        except Exception:
+            await run_in_threadpool(_release, record_id)
+            raise
+
+        if response.status_code >= 500:
+            await run_in_threadpool(_release, record_id)
+            return response
+
+        # Buffer the body so it can be both stored and sent
+        content = b"".join([chunk async for chunk in response.body_iterator])
+        await run_in_threadpool(_store, record_id, response.status_code, content, response.headers.get("content-type"))
+        headers = dict(response.headers)
+        headers.pop("content-length", None)
+        return Response(
+            content=content,
+            status_code=response.status_code,
+            headers=headers,
+        )
+
+
+def _too_many(retry_after: int, detail: str):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": detail},
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+# Routes that carry the company in the path
+COMPANY_PATH = re.compile(r"^/auth/(?:employees|appointments|rooms)/([^/]+)/?$")
+# Account routes are limited per client IP whatever company the request names,
+# so a made-up company_id can't buy a fresh bucket for login or password resets
+ACCOUNT_PATHS = {
+    "/auth/login",
+    "/auth/register",
+    "/auth/create-company",
+    "/auth/reset-password",
+    "/auth/companies",
+}
+# Larger JSON bodies aren't parsed just to find the company
+MAX_COMPANY_BODY = 64 * 1024
+# Proxies in front of the app that append to X-Forwarded-For (Render adds one)
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", 1))
+
+
+async def _company_id(request: Request):
+    """
+    Finds the company a request is for: company_id query param, X-Company-Id
+    header, company path segment, or company_id in a JSON body, in that order.
+    Account routes never belong to a company.
+    """
+    if request.url.path.rstrip("/") in ACCOUNT_PATHS:
+        return None
+    company_id = request.query_params.get("company_id") or request.headers.get("X-Company-Id")
+    if company_id:
+        return company_id
+    match = COMPANY_PATH.match(request.url.path)
+    if match:
+        return match.group(1)
+    if (
+        request.method in ("POST", "PUT", "PATCH")
+        and request.headers.get("content-type", "").startswith("application/json")
+        and request.headers.get("content-length", "").isdigit()
+        and int(request.headers["content-length"]) <= MAX_COMPANY_BODY
+    ):
+        try:
+            body = json.loads(await request.body() or b"null")
+        except ValueError:
+            return None
+        if isinstance(body, dict) and body.get("company_id"):
+            return str(body["company_id"])
+    return None
+
+
+def _client_ip(request: Request):
+    """
+    The caller's address as seen by the outermost trusted proxy. Each proxy
+    appends the address it received from, so earlier X-Forwarded-For entries
+    are whatever the client sent and can't be trusted.
+    """
+    forwarded = [hop.strip() for hop in request.headers.get("X-Forwarded-For", "").split(",") if hop.strip()]
+    if TRUSTED_PROXY_HOPS and forwarded:
+        return forwarded[-min(TRUSTED_PROXY_HOPS, len(forwarded))]
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimitMiddleware(BaseHTTPMiddleware):
+    """
+    Per-company admission control. Each company gets a token bucket per route
+    class (read, write, aggregate), and only a few aggregate requests of one
+    company may run at once. Account routes and requests that name no company
+    share the stricter "anonymous" class, keyed by client IP.
+    """
+
+    async def dispatch(self, request: Request, call_next):
+        company_id = await _company_id(request)
+        if company_id:
+            company_key = company_id
+            route = route_class(request.method, request.url.path)
+        else:
+            company_key = f"ip:{_client_ip(request)}"
+            route = "anonymous"
+
+        retry_after = await rate_limiter.check(company_key, route)
+        if retry_after is not None:
+            return _too_many(retry_after, "Too many requests, please slow down")
+
+        if route != "aggregate":
+            return await call_next(request)
+
+        if not rate_limiter.enter(company_key):
+            return _too_many(1, "Too many reports running for this company, please retry shortly")
+        try:
+            return await call_next(request)
+        finally:
+            rate_limiter.leave(company_key)
@@ -26,4 +26,5 @@ class AppointmentCreate(BaseModel):
     event_type: str
     event_completed: str
     cake_price: Optional[float] = None
-    cake_note: Optional[str] = None
\ No newline at end of file
+    cake_note: Optional[str] = None
+    room: Optional[str] = None  # hall/room within the venue; defaults to the company's first configured room
\ No newline at end of file
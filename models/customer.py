@@ -0,0 +1,191 @@
+from datetime import datetime
+from pymongo import UpdateOne, ReturnDocument, ASCENDING, DESCENDING
+from config.database import customers_collection, appointments_collection
+
+
+def normalize_phone(phone: str):
+    """
+    Reduces a phone number to its national digits so that
+    "+91 98765-43210", "09876543210" and "9876543210" map to the same customer.
+    """
+    digits = "".join(ch for ch in str(phone or "") if ch.isdigit())
+    if len(digits) == 12 and digits.startswith("91"):
+        digits = digits[2:]
+    return digits.lstrip("0")
+
+
+def _to_float(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def booking_spend(appointment: dict):
+    """
+    Income a booking brings in: booking amount plus add-on tag prices
+    (same definition as /payments/financial-summary).
+    """
+    addons = sum(_to_float(t.get("price")) for t in appointment.get("tags") or [])
+    return _to_float(appointment.get("booking_amount")) + addons
+
+
+def _is_counted(appointment):
+    return bool(appointment) and appointment.get("event_completed") != "deleted"
+
+
+def _customer_key(appointment: dict):
+    phone = normalize_phone(appointment.get("customer_phone"))
+    if not phone or not appointment.get("company_id"):
+        return None
+    return appointment["company_id"], phone
+
+
+def apply_booking_change(before: dict = None, after: dict = None):
+    """
+    Keeps the customers collection in step with a single appointment write.
+    `before` is the stored appointment prior to the write (None on create),
+    `after` the appointment as it is now (None on hard removal). Deleted
+    appointments don't count, so a soft delete is just an `after` with
+    event_completed == "deleted".
+    """
+    deltas = {}
+    removed = None
+    if _is_counted(before):
+        key = _customer_key(before)
+        if key:
+            d = deltas.setdefault(key, {"visits": 0, "spend": 0.0})
+            d["visits"] -= 1
+            d["spend"] -= booking_spend(before)
+            removed = key
+
+    current = None
+    if _is_counted(after):
+        key = _customer_key(after)
+        if key:
+            d = deltas.setdefault(key, {"visits": 0, "spend": 0.0})
+            d["visits"] += 1
+            d["spend"] += booking_spend(after)
+            current = key
+
+    # The visit date this write takes away from the `removed` customer, if any
+    old_visit = before.get("event_start_datetime") if removed else None
+    if removed == current and old_visit == after.get("event_start_datetime"):
+        old_visit = None
+
+    now = datetime.now()
+    for (company_id, phone), d in deltas.items():
+        update = {
+            "$inc": {"visit_count": d["visits"], "lifetime_spend": round(d["spend"], 2)},
+            "$set": {"updated_at": now},
+        }
+        if (company_id, phone) == current:
+            visit = after.get("event_start_datetime")
+            if visit:
+                update["$max"] = {"last_visit": visit}
+                update["$min"] = {"first_visit": visit}
+            update["$set"]["customer_name"] = after.get("customer_name")
+            update["$set"]["customer_phone"] = after.get("customer_phone")
+            update["$setOnInsert"] = {"created_at": now}
+        customer = customers_collection.find_one_and_update(
+            {"company_id": company_id, "phone": phone},
+            update,
+            projection={"visit_count": 1, "first_visit": 1, "last_visit": 1},
+            upsert=(company_id, phone) == current,
+            return_document=ReturnDocument.AFTER,
+        )
+        if not customer:
+            continue
+        # No bookings left: drop the customer rather than keep stale visit dates
+        if customer.get("visit_count", 0) <= 0:
+            customers_collection.delete_one({"_id": customer["_id"], "visit_count": {"$lte": 0}})
+        # $min/$max only move outward; re-read the dates if their edge went away
+        elif old_visit and (company_id, phone) == removed and old_visit in (customer.get("first_visit"), customer.get("last_visit")):
+            refresh_visit_dates(company_id, phone)
+
+
+def refresh_visit_dates(company_id: str, phone: str):
+    """
+    Recomputes a customer's first and last visit from their live appointments
+    (an indexed read on the appointments' normalized phone).
+    """
+    query = {
+        "company_id": company_id,
+        "phone_key": phone,
+        "event_completed": {"$ne": "deleted"},
+        "event_start_datetime": {"$ne": None},
+    }
+    first = appointments_collection.find_one(query, {"event_start_datetime": 1}, sort=[("event_start_datetime", ASCENDING)])
+    last = appointments_collection.find_one(query, {"event_start_datetime": 1}, sort=[("event_start_datetime", DESCENDING)])
+    if first:
+        update = {"$set": {"first_visit": first["event_start_datetime"], "last_visit": last["event_start_datetime"]}}
+    else:
+        update = {"$unset": {"first_visit": "", "last_visit": ""}}
+    customers_collection.update_one({"company_id": company_id, "phone": phone}, update)
+
+
+def backfill_phone_keys():
+    """
+    Stores the normalized phone as phone_key on appointments written before
+    it existed. Returns the number of appointments updated.
+    """
+    ops = [
+        UpdateOne({"_id": appt["_id"]}, {"$set": {"phone_key": normalize_phone(appt.get("customer_phone"))}})
+        for appt in appointments_collection.find({"phone_key": {"$exists": False}}, {"customer_phone": 1})
+    ]
+    if ops:
+        appointments_collection.bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+def rebuild_customer_stats(appointments):
+    """
+    Recomputes every customer document from the given appointments.
+    Used by the backfill script; returns the number of customers written.
+    """
+    stats = {}
+    for appt in appointments:
+        if not _is_counted(appt):
+            continue
+        key = _customer_key(appt)
+        if not key:
+            continue
+        s = stats.setdefault(key, {
+            "visit_count": 0,
+            "lifetime_spend": 0.0,
+            "first_visit": None,
+            "last_visit": None,
+            "customer_name": None,
+            "customer_phone": None,
+        })
+        s["visit_count"] += 1
+        s["lifetime_spend"] += booking_spend(appt)
+        visit = appt.get("event_start_datetime")
+        if visit:
+            if s["first_visit"] is None or visit < s["first_visit"]:
+                s["first_visit"] = visit
+            if s["last_visit"] is None or visit >= s["last_visit"]:
+                s["last_visit"] = visit
+                s["customer_name"] = appt.get("customer_name")
+                s["customer_phone"] = appt.get("customer_phone")
+        elif s["customer_name"] is None:
+            s["customer_name"] = appt.get("customer_name")
+            s["customer_phone"] = appt.get("customer_phone")
+
+    now = datetime.now()
+    ops = []
+    for (company_id, phone), s in stats.items():
+        s["lifetime_spend"] = round(s["lifetime_spend"], 2)
+        s["updated_at"] = now
+        # Leave visit dates unset rather than null so later $min/$max work
+        s = {k: v for k, v in s.items() if v is not None}
+        ops.append(UpdateOne(
+            {"company_id": company_id, "phone": phone},
+            {"$set": s, "$setOnInsert": {"created_at": now}},
+            upsert=True,
+        ))
+    if ops:
+        customers_collection.bulk_write(ops, ordered=False)
+    # Anything not rewritten above no longer has a live booking
+    customers_collection.delete_many({"updated_at": {"$lt": now}})
+    return len(ops)
@@ -0,0 +1,203 @@
+from datetime import datetime, date
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from config.database import employee_ledgers_collection, payments_collection, spents_collection
+
+
+def month_key(value):
+    """
+    Normalizes a month to "YYYY-MM". Accepts dates/datetimes and the salary
+    month strings the app sends ("June 2025", "Jun 2025", "2025-06", "06-2025").
+    """
+    if isinstance(value, (date, datetime)):
+        return f"{value.year}-{value.month:02d}"
+    text = str(value or "").strip()
+    for fmt in ("%B %Y", "%b %Y", "%Y-%m", "%m-%Y"):
+        try:
+            parsed = datetime.strptime(text, fmt)
+            return f"{parsed.year}-{parsed.month:02d}"
+        except ValueError:
+            continue
+    # Unknown format: keep it, but make it safe to use as a field name
+    return text.replace(".", "_").replace("$", "_")
+
+
+def _amount(value):
+    try:
+        return round(float(value or 0), 2)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _ledger_filter(company_id, employee_name):
+    return {"company_id": company_id, "employee_name": employee_name}
+
+
+def record_payment(company_id: str, employee_name: str, paid_date, amount, count: int = 1):
+    """
+    Adds (or with a negative amount/count, removes) a payment on the employee ledger.
+    """
+    now = datetime.now()
+    employee_ledgers_collection.update_one(
+        _ledger_filter(company_id, employee_name),
+        {
+            "$inc": {
+                f"payments_by_month.{month_key(paid_date)}": _amount(amount),
+                "total_paid": _amount(amount),
+                "payment_count": count,
+            },
+            "$set": {"updated_at": now},
+            "$setOnInsert": {"created_at": now},
+        },
+        upsert=True,
+    )
+
+
+def claim_salary_month(company_id: str, employee_name: str, salary_month, amount):
+    """
+    Marks a salary month as paid on the ledger. Returns False if that month was
+    already paid. The check and the write are a single atomic update, so two
+    concurrent requests for the same month can't both succeed.
+    """
+    key = month_key(salary_month)
+    now = datetime.now()
+    for _ in range(2):
+        try:
+            employee_ledgers_collection.update_one(
+                {
+                    **_ledger_filter(company_id, employee_name),
+                    f"salary_by_month.{key}": {"$exists": False},
+                },
+                {
+                    "$set": {f"salary_by_month.{key}": _amount(amount), "updated_at": now},
+                    "$inc": {"total_paid": _amount(amount), "payment_count": 1},
+                    "$setOnInsert": {"created_at": now},
+                },
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            # Either the month is taken, or another request created the
+            # ledger first; the retry tells the two apart.
+            continue
+    return False
+
+
+def release_salary_month(company_id: str, employee_name: str, salary_month, amount):
+    employee_ledgers_collection.update_one(
+        {
+            **_ledger_filter(company_id, employee_name),
+            f"salary_by_month.{month_key(salary_month)}": {"$exists": True},
+        },
+        {
+            "$unset": {f"salary_by_month.{month_key(salary_month)}": ""},
+            "$inc": {"total_paid": -_amount(amount), "payment_count": -1},
+            "$set": {"updated_at": datetime.now()},
+        },
+    )
+
+
+def _is_salary(spent):
+    return bool(spent) and spent.get("type") == "Salary" and spent.get("salary_person") and spent.get("salary_month")
+
+
+def move_salary(before: dict, after: dict):
+    """
+    Applies an edit of a spent record to the ledger. Returns False (and leaves
+    the ledger untouched) if the edit would pay a month that is already paid.
+    """
+    old = _is_salary(before)
+    new = _is_salary(after)
+    same_slot = old and new and (
+        before.get("company_id") == after.get("company_id")
+        and before["salary_person"] == after["salary_person"]
+        and month_key(before["salary_month"]) == month_key(after["salary_month"])
+    )
+
+    if same_slot:
+        diff = round(_amount(after.get("amount")) - _amount(before.get("amount")), 2)
+        if diff:
+            key = month_key(after["salary_month"])
+            employee_ledgers_collection.update_one(
+                _ledger_filter(after.get("company_id"), after["salary_person"]),
+                {
+                    "$inc": {f"salary_by_month.{key}": diff, "total_paid": diff},
+                    "$set": {"updated_at": datetime.now()},
+                },
+            )
+        return True
+
+    if new and not claim_salary_month(after.get("company_id"), after["salary_person"], after["salary_month"], after.get("amount")):
+        return False
+    if old:
+        release_salary_month(before.get("company_id"), before["salary_person"], before["salary_month"], before.get("amount"))
+    return True
+
+
+def rebuild_ledgers(payments, spents):
+    """
+    Recomputes every ledger from the payment and salary history.
+    Used by the backfill script; returns the number of ledgers written.
+    """
+    ledgers = {}
+
+    def ledger_for(company_id, employee_name):
+        return ledgers.setdefault((company_id, employee_name), {
+            "payments_by_month": {},
+            "salary_by_month": {},
+            "total_paid": 0.0,
+            "payment_count": 0,
+        })
+
+    for p in payments:
+        if not p.get("employee_name"):
+            continue
+        ledger = ledger_for(p.get("company_id"), p["employee_name"])
+        key = month_key(p.get("paid_date"))
+        ledger["payments_by_month"][key] = round(ledger["payments_by_month"].get(key, 0) + _amount(p.get("amount")), 2)
+        ledger["total_paid"] += _amount(p.get("amount"))
+        ledger["payment_count"] += 1
+
+    for s in spents:
+        if not _is_salary(s):
+            continue
+        ledger = ledger_for(s.get("company_id"), s["salary_person"])
+        key = month_key(s["salary_month"])
+        ledger["salary_by_month"][key] = round(ledger["salary_by_month"].get(key, 0) + _amount(s.get("amount")), 2)
+        ledger["total_paid"] += _amount(s.get("amount"))
+        ledger["payment_count"] += 1
+
+    now = datetime.now()
+    ops = []
+    for (company_id, employee_name), ledger in ledgers.items():
+        ledger["total_paid"] = round(ledger["total_paid"], 2)
+        ledger["updated_at"] = now
+        ops.append(UpdateOne(
+            _ledger_filter(company_id, employee_name),
+            {"$set": ledger, "$setOnInsert": {"created_at": now}},
+            upsert=True,
+        ))
+    if ops:
+        employee_ledgers_collection.bulk_write(ops, ordered=False)
+    # Ledgers not rewritten above have no payments left; keep their salary setting
+    employee_ledgers_collection.update_many(
+        {"updated_at": {"$lt": now}},
+        {"$set": {
+            "payments_by_month": {},
+            "salary_by_month": {},
+            "total_paid": 0.0,
+            "payment_count": 0,
+            "updated_at": now,
+        }},
+    )
+    return len(ops)
+
+
+def backfill_ledgers():
+    """Rebuilds all ledgers from the payments and Salary spents collections."""
+    payments = payments_collection.find({}, {"company_id": 1, "employee_name": 1, "paid_date": 1, "amount": 1})
+    spents = spents_collection.find(
+        {"type": "Salary"},
+        {"company_id": 1, "type": 1, "salary_person": 1, "salary_month": 1, "amount": 1},
+    )
+    return rebuild_ledgers(payments, spents)
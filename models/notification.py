@@ -1,28 +1,230 @@
 # utils/notification.py
 
 from twilio.rest import Client
+from twilio.http.http_client import TwilioHttpClient
+from twilio.base.exceptions import TwilioRestException
+from requests.exceptions import Timeout, ConnectionError as RequestsConnectionError
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import threading
+import time
 import os
 
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
+TWILIO_WHATSAPP_NUMBER = 'whatsapp:+14155238886'  # Twilio WhatsApp sandbox number
 
-client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+# Fail fast instead of waiting on a slow provider
+TWILIO_TIMEOUT = float(os.getenv("TWILIO_TIMEOUT", 5))
+# Send to e.g. http://localhost:8099 (scripts/twilio_stub.py) instead of Twilio
+TWILIO_API_BASE_URL = os.getenv("TWILIO_API_BASE_URL")
+
+# Circuit breaker: open after this many provider failures in a row, probe again after the cooldown
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("MESSAGING_BREAKER_FAILURES", 5))
+BREAKER_RESET_SECONDS = float(os.getenv("MESSAGING_BREAKER_RESET_SECONDS", 30))
+# Messages held while the provider is unhealthy; oldest are dropped beyond this
+MESSAGE_QUEUE_SIZE = int(os.getenv("MESSAGING_QUEUE_SIZE", 500))
+# Queued messages older than this are dropped: a late "booking confirmed" is worse than none
+MESSAGE_MAX_AGE_SECONDS = float(os.getenv("MESSAGING_MAX_AGE_SECONDS", 900))
+# Concurrent requests to the provider per channel
+CHANNEL_LIMITS = {
+    "sms": int(os.getenv("MESSAGING_SMS_CONCURRENCY", 4)),
+    "whatsapp": int(os.getenv("MESSAGING_WHATSAPP_CONCURRENCY", 4)),
+}
+CHANNEL_WAIT_SECONDS = 2
+
+
+class _HttpClient(TwilioHttpClient):
+    def request(self, method, url, *args, **kwargs):
+        if TWILIO_API_BASE_URL:
+            url = url.replace("https://api.twilio.com", TWILIO_API_BASE_URL.rstrip("/"), 1)
+        return super().request(method, url, *args, **kwargs)
+
+
+# One keep-alive session shared by every send
+client = Client(
+    TWILIO_ACCOUNT_SID,
+    TWILIO_AUTH_TOKEN,
+    http_client=_HttpClient(pool_connections=True, timeout=TWILIO_TIMEOUT),
+)
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` failures in a row; while open every
+    call is refused. After `reset_seconds` one probe call is let through: success
+    closes the breaker, failure keeps it open for another cooldown.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_seconds and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def failure(self):
+        """
+        Records a failure. Returns True only when this call opened the breaker:
+        the closed -> open transition, or a failed half-open probe starting a
+        new cooldown. Failures of calls already in flight while open return False.
+        """
+        with self.lock:
+            self.failures += 1
+            was_probe = self.probing
+            self.probing = False
+            if was_probe or (self.opened_at is None and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+
+breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS)
+pending = deque(maxlen=MESSAGE_QUEUE_SIZE)
+_channel_slots = {channel: threading.BoundedSemaphore(n) for channel, n in CHANNEL_LIMITS.items()}
+_executor = ThreadPoolExecutor(max_workers=sum(CHANNEL_LIMITS.values()), thread_name_prefix="messaging")
+_flushing = threading.Lock()
+
+
+def _address(channel: str, to: str):
+    if channel == "whatsapp":
+        return TWILIO_WHATSAPP_NUMBER, f"whatsapp:{to}"  # Format: whatsapp:+91xxxxxxxxxx
+    return TWILIO_PHONE_NUMBER, to
+
+
+def _schedule_flush(delay: float):
+    timer = threading.Timer(delay, flush_pending)
+    timer.daemon = True
+    timer.start()
+
+
+def _deliver(channel: str, to: str, message: str, queued_at: float = None):
+    """
+    Sends one message, or queues it when the breaker is open or the channel is
+    saturated. Returns True if the provider accepted it. `queued_at` is kept
+    across retries so the message's age counts from when it was first queued.
+    """
+    label = "WhatsApp message" if channel == "whatsapp" else "SMS"
+    entry = (channel, to, message, queued_at or time.monotonic())
+    if not _channel_slots[channel].acquire(timeout=CHANNEL_WAIT_SECONDS):
+        pending.append(entry)
+        print(f"{label} queued: {channel} channel busy")
+        return False
+    try:
+        if not breaker.allow():
+            pending.append(entry)
+            print(f"{label} queued: messaging provider unavailable")
+            return False
+        from_, to_ = _address(channel, to)
+        try:
+            msg = client.messages.create(body=message, from_=from_, to=to_)
+        except TwilioRestException as e:
+            if e.status >= 500 or e.status == 429:
+                if breaker.failure():
+                    _schedule_flush(BREAKER_RESET_SECONDS)
+                pending.append(entry)
+            else:
+                # The provider is up, it just rejected this message; don't retry it
+                breaker.success()
+            print(f"Failed to send {label}: {e}")
+            return False
+        except (Timeout, RequestsConnectionError) as e:
+            if breaker.failure():
+                _schedule_flush(BREAKER_RESET_SECONDS)
+            pending.append(entry)
+            print(f"Failed to send {label}: {e}")
+            return False
+        except Exception as e:
+            # Not a provider outage (bad input, a bug): retrying won't help
+            print(f"Failed to send {label}, dropped: {e!r}")
+            return False
+        breaker.success()
+        print(f"{label} sent: SID {msg.sid}")
+    finally:
+        _channel_slots[channel].release()
+
+    if pending and not _flushing.locked():
+        _schedule_flush(0)
+    return True
+
+
+def send_bulk(messages):
+    """
+    Sends (channel, to, message) tuples concurrently, within the per-channel
+    limits, and waits for all of them. Returns how many were accepted.
+    Queued entries carry a fourth item, the time they were first queued.
+    """
+    futures = [_executor.submit(_deliver, *message) for message in messages if message[1]]
+    return sum(1 for f in futures if f.result())
+
+
+def flush_pending():
+    """Retries queued messages; anything that fails again goes back on the queue."""
+    if not _flushing.acquire(blocking=False):
+        return
+    try:
+        for _ in range(3):
+            batch = []
+            expired = 0
+            cutoff = time.monotonic() - MESSAGE_MAX_AGE_SECONDS
+            while pending:
+                entry = pending.popleft()
+                if entry[3] < cutoff:
+                    expired += 1
+                else:
+                    batch.append(entry)
+            if expired:
+                print(f"Dropped {expired} queued message(s) older than {MESSAGE_MAX_AGE_SECONDS:.0f}s")
+            if not batch:
+                break
+            print(f"Retrying {len(batch)} queued message(s)")
+            send_bulk(batch)
+            if breaker.state != "closed":
+                break
+    finally:
+        _flushing.release()
+    if pending and breaker.state != "closed":
+        _schedule_flush(BREAKER_RESET_SECONDS)
+
+
+def messaging_status():
+    return {
+        "breaker": breaker.state,
+        "consecutive_failures": breaker.failures,
+        "queued": len(pending),
+    }
 
 
 def send_sms(to: str, message: str):
     """
     Sends an SMS using Twilio
     """
-    try:
-        sms = client.messages.create(
-            body=message,
-            from_=TWILIO_PHONE_NUMBER,
-            to=to
-        )
-        print(f"SMS sent: SID {sms.sid}")
-    except Exception as e:
-        print(f"Failed to send SMS: {e}")
+    _deliver("sms", to, message)
 
 
 def send_whatsapp(to: str, message: str):
@@ -30,12 +232,11 @@ def send_whatsapp(to: str, message: str):
     Sends a WhatsApp message using Twilio Sandbox (for testing)
     Make sure you’ve joined Twilio Sandbox and used the right `to` format: 'whatsapp:+91xxxxxxxxxx'
     """
-    try:
-        whatsapp_msg = client.messages.create(
-            body=message,
-            from_='whatsapp:+14155238886',  # Twilio WhatsApp sandbox number
-            to=f"whatsapp:{to}"              # Format: whatsapp:+91xxxxxxxxxx
-        )
-        print(f"WhatsApp message sent: SID {whatsapp_msg.sid}")
-    except Exception as e:
-        print(f"Failed to send WhatsApp message: {e}")
+    _deliver("whatsapp", to, message)
+
+
+def notify_customer(to: str, message: str):
+    """
+    Sends the same message by SMS and WhatsApp in parallel
+    """
+    send_bulk([("sms", to, message), ("whatsapp", to, message)])
@@ -0,0 +1,191 @@
+from datetime import datetime, date, time, timedelta
+from math import ceil
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+from config.database import db, appointments_collection, room_occupancy_collection
+
+# Each room/day is a 48-bit integer: bit i set = the 30-minute slot starting at
+# i * 30 minutes past midnight is taken.
+SLOT_MINUTES = 30
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+DEFAULT_ROOM = "main"
+
+
+def room_of(appointment: dict):
+    return appointment.get("room") or DEFAULT_ROOM
+
+
+def room_filter(room: str):
+    # Appointments created before rooms existed have no room and live in the default one
+    if room == DEFAULT_ROOM:
+        return {"room": {"$in": [DEFAULT_ROOM, None]}}
+    return {"room": room}
+
+
+def slot_count(duration_minutes: int):
+    return ceil(duration_minutes / SLOT_MINUTES)
+
+
+def slot_index(at: time):
+    return (at.hour * 60 + at.minute) // SLOT_MINUTES
+
+
+def day_masks(start: datetime, end: datetime):
+    """
+    Splits [start, end) into per-day slot masks, e.g. {"2025-06-01": 0b1100...}.
+    Partially covered slots count as taken.
+    """
+    masks = {}
+    if not start or not end or end <= start:
+        return masks
+    day = start.date()
+    while datetime.combine(day, time()) < end:
+        day_start = datetime.combine(day, time())
+        first = max(start, day_start)
+        last = min(end, day_start + timedelta(days=1))
+        i = int((first - day_start).total_seconds() // (SLOT_MINUTES * 60))
+        j = ceil((last - day_start).total_seconds() / (SLOT_MINUTES * 60))
+        if j > i:
+            masks[day.isoformat()] = ((1 << (j - i)) - 1) << i
+        day += timedelta(days=1)
+    return masks
+
+
+def _is_counted(appointment):
+    return bool(appointment) and appointment.get("event_completed") != "deleted"
+
+
+def mark_occupied(appointment: dict):
+    """Sets the appointment's slots on its room's day bitmaps."""
+    if not _is_counted(appointment):
+        return
+    now = datetime.now()
+    for day, mask in day_masks(appointment.get("event_start_datetime"), appointment.get("event_end_datetime")).items():
+        room_occupancy_collection.update_one(
+            {"company_id": appointment["company_id"], "room": room_of(appointment), "day": day},
+            {"$bit": {"bits": {"or": mask}}, "$set": {"updated_at": now}},
+            upsert=True,
+        )
+
+
+def rebuild_day(company_id: str, room: str, day: str):
+    """
+    Recomputes one room/day bitmap from the appointments. Clearing bits directly
+    is unsafe because two short bookings can share a slot.
+    """
+    day_start = datetime.combine(date.fromisoformat(day), time())
+    day_end = day_start + timedelta(days=1)
+    bits = 0
+    for appt in appointments_collection.find({
+        "company_id": company_id,
+        "event_completed": {"$ne": "deleted"},
+        "event_start_datetime": {"$lt": day_end},
+        "event_end_datetime": {"$gt": day_start},
+        **room_filter(room),
+    }, {"event_start_datetime": 1, "event_end_datetime": 1}):
+        bits |= day_masks(appt["event_start_datetime"], appt["event_end_datetime"]).get(day, 0)
+    room_occupancy_collection.update_one(
+        {"company_id": company_id, "room": room, "day": day},
+        {"$set": {"bits": bits, "updated_at": datetime.now()}},
+        upsert=True,
+    )
+
+
+def refresh_occupancy(before: dict, after: dict):
+    """
+    Brings the bitmaps in line after an appointment changed. New bookings only
+    add bits; anything that may have freed a slot rebuilds the affected days.
+    """
+    if before is None:
+        mark_occupied(after)
+        return
+    touched = set()
+    for appt in (before, after):
+        if not appt or not appt.get("company_id"):
+            continue
+        for day in day_masks(appt.get("event_start_datetime"), appt.get("event_end_datetime")):
+            touched.add((appt["company_id"], room_of(appt), day))
+    for company_id, room, day in touched:
+        rebuild_day(company_id, room, day)
+
+
+def company_rooms(company_id: str):
+    try:
+        company = db["users"].find_one({"_id": ObjectId(company_id)}, {"rooms": 1})
+    except InvalidId:
+        company = None
+    return (company or {}).get("rooms") or [DEFAULT_ROOM]
+
+
+def resolve_room(company_id: str, requested: str = None, current: str = None):
+    """
+    Picks the room for a booking: the requested one, else the room it is
+    already in, else the company's first configured room. Returns None if the
+    requested room isn't one of the company's rooms. A booking may stay in a
+    room that has since been removed from the list.
+    """
+    if requested and requested == current:
+        return requested
+    rooms = company_rooms(company_id)
+    if requested:
+        return requested if requested in rooms else None
+    return current or rooms[0]
+
+
+def load_occupancy(company_id: str, first_day: date, days: int = 1, room: str = None):
+    """
+    Reads the bitmaps for `days` consecutive days starting at first_day and
+    joins them per room into one integer (day k occupies bits 48k..48k+47).
+    Returns (rooms, {room: bits}).
+    """
+    day_keys = [(first_day + timedelta(days=k)).isoformat() for k in range(days)]
+    query = {"company_id": company_id, "day": {"$in": day_keys}}
+    if room:
+        query["room"] = room
+    occupancy = {}
+    for doc in room_occupancy_collection.find(query, {"room": 1, "day": 1, "bits": 1}):
+        offset = day_keys.index(doc["day"]) * SLOTS_PER_DAY
+        occupancy[doc["room"]] = occupancy.get(doc["room"], 0) | (int(doc.get("bits", 0)) << offset)
+
+    if room:
+        rooms = [room]
+    else:
+        rooms = company_rooms(company_id)
+        rooms += [r for r in sorted(occupancy) if r not in rooms]
+    return rooms, occupancy
+
+
+def free_rooms(rooms, occupancy, start_index: int, slots: int):
+    mask = ((1 << slots) - 1) << start_index
+    return [r for r in rooms if not occupancy.get(r, 0) & mask]
+
+
+def backfill_occupancy():
+    """
+    Rebuilds every room/day bitmap from the appointments.
+    Returns the number of room-days written.
+    """
+    bitmaps = {}
+    for appt in appointments_collection.find(
+        {"event_completed": {"$ne": "deleted"}, "event_start_datetime": {"$exists": True}},
+        {"company_id": 1, "room": 1, "event_start_datetime": 1, "event_end_datetime": 1},
+    ):
+        for day, mask in day_masks(appt.get("event_start_datetime"), appt.get("event_end_datetime")).items():
+            key = (appt.get("company_id"), room_of(appt), day)
+            bitmaps[key] = bitmaps.get(key, 0) | mask
+
+    now = datetime.now()
+    ops = [
+        UpdateOne(
+            {"company_id": company_id, "room": room, "day": day},
+            {"$set": {"bits": bits, "updated_at": now}},
+            upsert=True,
+        )
+        for (company_id, room, day), bits in bitmaps.items()
+    ]
+    if ops:
+        room_occupancy_collection.bulk_write(ops, ordered=False)
+    # Bitmaps with no live appointment left
+    room_occupancy_collection.delete_many({"updated_at": {"$lt": now}})
+    return len(ops)
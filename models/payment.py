@@ -5,4 +5,8 @@ class PaymentCreate(BaseModel):
     employee_name: str
     amount: float
     paid_date: date
-    company_id: str
\ No newline at end of file
+    company_id: str
+
+class EmployeeSalaryUpdate(BaseModel):
+    company_id: str
+    monthly_salary: float
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 class UserCreate(BaseModel):
     phone: str
@@ -27,4 +27,7 @@ class UserCreateCompany(BaseModel):
     email: str
     address: str
     company_name: str
-    user_type: str  # Should be 'admin'
\ No newline at end of file
+    user_type: str  # Should be 'admin'
+
+class CompanyRooms(BaseModel):
+    rooms: List[str]
\ No newline at end of file
@@ -0,0 +1,153 @@
+import os
+import time
+from collections import OrderedDict
+from math import ceil
+
+# Route classes and their token buckets: (burst capacity, refill per second).
+# Override with e.g. RATE_LIMIT_AGGREGATE="5,0.2".
+def _limit(name: str, default: str):
+    capacity, rate = os.getenv(f"RATE_LIMIT_{name.upper()}", default).split(",")
+    return float(capacity), float(rate)
+
+LIMITS = {
+    "read": _limit("read", "60,10"),
+    "write": _limit("write", "30,5"),
+    "aggregate": _limit("aggregate", "10,0.5"),
+    # Requests that carry no company (login, registration, edits by id), per client IP
+    "anonymous": _limit("anonymous", "20,2"),
+}
+# Upper bound on in-process buckets kept at once
+MAX_LOCAL_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_LOCAL_BUCKETS", 50000))
+# Expensive requests a single company may have running at once (per process)
+MAX_CONCURRENT_AGGREGATES = int(os.getenv("RATE_LIMIT_MAX_CONCURRENT_AGGREGATES", 4))
+
+AGGREGATE_PATHS = {
+    "/payments/financial-summary",
+    "/appointments/monthly-summary",
+    "/appointments/available-slots",
+    "/appointments/free-rooms",
+    "/spents/monthly-summary",
+    "/dashboard",
+    "/sync",
+}
+
+rate_limit_stats = {name: {"allowed": 0, "rejected": 0} for name in LIMITS}
+
+
+def route_class(method: str, path: str):
+    if path.rstrip("/") in AGGREGATE_PATHS:
+        return "aggregate"
+    return "read" if method in ("GET", "HEAD") else "write"
+
+
+class LocalBuckets:
+    """
+    In-process token buckets. Only called from the event loop, so no locking.
+    Buckets that have refilled to capacity are indistinguishable from new ones
+    and are swept periodically; beyond MAX_LOCAL_BUCKETS the least recently
+    used are dropped, so arbitrary keys can't grow memory without bound.
+    """
+
+    SWEEP_SECONDS = 60
+
+    def __init__(self):
+        # key -> (tokens, last, time at which the bucket is full again)
+        self.buckets = OrderedDict()
+        self.last_sweep = time.monotonic()
+
+    def _sweep(self, now: float):
+        self.last_sweep = now
+        for key in [k for k, (_, _, full_at) in self.buckets.items() if full_at <= now]:
+            del self.buckets[key]
+
+    async def take(self, key: str, capacity: float, rate: float):
+        now = time.monotonic()
+        if now - self.last_sweep >= self.SWEEP_SECONDS:
+            self._sweep(now)
+        tokens, last, _ = self.buckets.get(key, (capacity, now, now))
+        tokens = min(capacity, tokens + (now - last) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self.buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+        self.buckets.move_to_end(key)
+        while len(self.buckets) > MAX_LOCAL_BUCKETS:
+            self.buckets.popitem(last=False)
+        return allowed, tokens
+
+
+# Refill-and-take in one atomic step on the Redis side
+_REDIS_TAKE = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisBuckets:
+    """
+    Token buckets shared by all workers through Redis. Falls back to the local
+    buckets if Redis can't be reached, so an outage doesn't take the API down.
+    """
+
+    def __init__(self, url: str):
+        import redis.asyncio as aioredis  # optional dependency
+
+        self.redis = aioredis.from_url(url)
+        self.script = self.redis.register_script(_REDIS_TAKE)
+        self.fallback = LocalBuckets()
+
+    async def take(self, key: str, capacity: float, rate: float):
+        try:
+            allowed, tokens = await self.script(keys=[f"ratelimit:{key}"], args=[capacity, rate, time.time()])
+            return bool(allowed), float(tokens)
+        except Exception as e:
+            print(f"Rate limit backend unavailable, using local buckets: {e}")
+            return await self.fallback.take(key, capacity, rate)
+
+
+class RateLimiter:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.running = {}
+
+    async def check(self, company_key: str, route: str):
+        """Returns None if allowed, else the number of seconds to wait."""
+        capacity, rate = LIMITS[route]
+        allowed, tokens = await self.buckets.take(f"{company_key}:{route}", capacity, rate)
+        if allowed:
+            rate_limit_stats[route]["allowed"] += 1
+            return None
+        rate_limit_stats[route]["rejected"] += 1
+        return max(1, ceil((1 - tokens) / rate))
+
+    def enter(self, company_key: str):
+        """Claims an aggregate slot for the company; False if it has too many running."""
+        if self.running.get(company_key, 0) >= MAX_CONCURRENT_AGGREGATES:
+            rate_limit_stats["aggregate"]["rejected"] += 1
+            return False
+        self.running[company_key] = self.running.get(company_key, 0) + 1
+        return True
+
+    def leave(self, company_key: str):
+        left = self.running.get(company_key, 1) - 1
+        if left > 0:
+            self.running[company_key] = left
+        else:
+            self.running.pop(company_key, None)
+
+
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+rate_limiter = RateLimiter(RedisBuckets(RATE_LIMIT_REDIS_URL) if RATE_LIMIT_REDIS_URL else LocalBuckets())
@@ -1,9 +1,15 @@
 from fastapi import APIRouter, HTTPException, BackgroundTasks, Query
 from models.appointment import AppointmentCreate
-from config.database import appointments_collection
+from config.database import appointments_collection, analytics_appointments_collection, ANALYTICS_MAX_TIME_MS
 from bson import ObjectId
 from datetime import datetime, date, time, timedelta
-from models.notification import send_sms, send_whatsapp
+from models.notification import send_sms, notify_customer
+from models.customer import apply_booking_change, normalize_phone
+from models.occupancy import (
+    SLOT_MINUTES, SLOTS_PER_DAY, room_filter, room_of, refresh_occupancy, resolve_room,
+    slot_count, slot_index, load_occupancy, free_rooms
+)
+from utils import single_flight, sync_now
 
 router = APIRouter()
 
@@ -22,12 +28,16 @@ async def create_appointment(data: AppointmentCreate, background_tasks: Backgrou
     event_end = datetime.combine(appointment_dict["event_date"], appointment_dict["event_end_time"])
     appointment_dict["event_start_datetime"] = event_start
     appointment_dict["event_end_datetime"] = event_end
+    appointment_dict["room"] = resolve_room(appointment_dict["company_id"], appointment_dict.get("room"))
+    if not appointment_dict["room"]:
+        raise HTTPException(status_code=400, detail="Unknown room for this company")
 
     overlapping = appointments_collection.find_one({
         "company_id": appointment_dict["company_id"],
         "event_completed": {"$ne": "deleted"},
         "event_start_datetime": {"$lt": event_end},
-        "event_end_datetime": {"$gt": event_start}
+        "event_end_datetime": {"$gt": event_start},
+        **room_filter(appointment_dict["room"])
     })
 
     if overlapping:
@@ -36,15 +46,18 @@ async def create_appointment(data: AppointmentCreate, background_tasks: Backgrou
     appointment_dict["event_date"] = appointment_dict["event_date"].isoformat()
     appointment_dict["event_start_time"] = appointment_dict["event_start_time"].isoformat()
     appointment_dict["event_end_time"] = appointment_dict["event_end_time"].isoformat()
+    appointment_dict["phone_key"] = normalize_phone(appointment_dict.get("customer_phone"))
+    appointment_dict["updated_at"] = sync_now()
 
     result = appointments_collection.insert_one(appointment_dict)
+    apply_booking_change(None, appointment_dict)
+    refresh_occupancy(None, appointment_dict)
 
     # Send SMS & WhatsApp
     customer_phone = appointment_dict.get("customer_phone")
     if customer_phone:
         message = f"Hi {appointment_dict.get('customer_name')}, your booking for {appointment_dict.get('event_type')} is confirmed on {appointment_dict['event_date']} from {appointment_dict['event_start_time']} to {appointment_dict['event_end_time']}."
-        background_tasks.add_task(send_sms, customer_phone, message)
-        background_tasks.add_task(send_whatsapp, customer_phone, message)
+        background_tasks.add_task(notify_customer, customer_phone, message)
 
         # Schedule reminder 1 hour before
         reminder_time = event_start - timedelta(hours=1)
@@ -57,7 +70,7 @@ async def create_appointment(data: AppointmentCreate, background_tasks: Backgrou
 async def mark_event_completed(id: str):
     result = appointments_collection.update_one(
         {"_id": ObjectId(id)},
-        {"$set": {"event_completed": "true"}}
+        {"$set": {"event_completed": "true", "updated_at": sync_now()}}
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Appointment not found")
@@ -77,7 +90,7 @@ async def get_appointments(company_id: str):
             if appt["event_end_datetime"] < now and appt.get("event_completed") != "true":
                 appointments_collection.update_one(
                     {"_id": appt["_id"]},
-                    {"$set": {"event_completed": "true"}}
+                    {"$set": {"event_completed": "true", "updated_at": sync_now()}}
                 )
                 appt["event_completed"] = "true"
 
@@ -102,6 +115,7 @@ async def delete_appointment(id: str, reason: str, deleted_by: str, refund_amoun
     delete_info = {
         "event_completed": "deleted",
         "deleted_at": datetime.now(),
+        "updated_at": sync_now(),
         "delete_reason": reason,
         "refund_amount": refund_amount,
         "refund_reason": refund_reason,
@@ -113,12 +127,13 @@ async def delete_appointment(id: str, reason: str, deleted_by: str, refund_amoun
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Appointment not found")
+    apply_booking_change(appointment, {**appointment, **delete_info})
+    refresh_occupancy(appointment, {**appointment, **delete_info})
 
     # Notify customer
     if appointment and background_tasks:
         message = f"Hi {appointment.get('customer_name')}, your booking on {appointment.get('event_date')} has been cancelled. Refund: ₹{refund_amount}. Reason: {reason}."
-        background_tasks.add_task(send_sms, appointment.get("customer_phone"), message)
-        background_tasks.add_task(send_whatsapp, appointment.get("customer_phone"), message)
+        background_tasks.add_task(notify_customer, appointment.get("customer_phone"), message)
 
     return {"message": "Appointment marked as deleted with reason"}
 
@@ -137,6 +152,14 @@ async def get_deleted_appointments(company_id: str):
 @router.put("/{id}")
 async def update_appointment(id: str, data: AppointmentCreate, edited_by: str = "Unknown", background_tasks: BackgroundTasks = None):
     update_data = data.dict()
+    existing = appointments_collection.find_one({"_id": ObjectId(id)})
+    if not existing:
+        raise HTTPException(status_code=404, detail="Appointment not found")
+    # Clients that don't send a room keep the booking where it is; bookings
+    # from before rooms existed stay in the default room
+    update_data["room"] = resolve_room(update_data["company_id"], update_data.get("room"), room_of(existing))
+    if not update_data["room"]:
+        raise HTTPException(status_code=400, detail="Unknown room for this company")
 
     if update_data.get("event_date") and update_data.get("event_start_time") and update_data.get("event_end_time"):
         event_start = datetime.combine(update_data["event_date"], update_data["event_start_time"])
@@ -149,7 +172,8 @@ async def update_appointment(id: str, data: AppointmentCreate, edited_by: str =
             "event_completed": {"$ne": "deleted"},
             "event_start_datetime": {"$lt": event_end},
             "event_end_datetime": {"$gt": event_start},
-            "_id": {"$ne": ObjectId(id)}
+            "_id": {"$ne": ObjectId(id)},
+            **room_filter(update_data["room"])
         })
 
         if overlapping:
@@ -161,6 +185,8 @@ async def update_appointment(id: str, data: AppointmentCreate, edited_by: str =
 
     update_data["last_edited_by"] = edited_by
     update_data["last_edited_at"] = datetime.now()
+    update_data["phone_key"] = normalize_phone(update_data.get("customer_phone"))
+    update_data["updated_at"] = sync_now()
 
     result = appointments_collection.update_one(
         {"_id": ObjectId(id)},
@@ -169,11 +195,12 @@ async def update_appointment(id: str, data: AppointmentCreate, edited_by: str =
 
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Appointment not found")
+    apply_booking_change(existing, {**existing, **update_data})
+    refresh_occupancy(existing, {**existing, **update_data})
 
     if background_tasks:
         message = f"Hi {update_data.get('customer_name')}, your booking has been updated. New time: {update_data['event_start_time']} to {update_data['event_end_time']} on {update_data['event_date']}."
-        background_tasks.add_task(send_sms, update_data.get("customer_phone"), message)
-        background_tasks.add_task(send_whatsapp, update_data.get("customer_phone"), message)
+        background_tasks.add_task(notify_customer, update_data.get("customer_phone"), message)
 
     return {"message": "Appointment updated"}
 
@@ -192,8 +219,8 @@ async def monthly_summary(company_id: str):
         }},
         {"$sort": {"_id.year": 1, "_id.month": 1}}
     ]
-    result = list(appointments_collection.aggregate(pipeline))
-    total_appointments = appointments_collection.count_documents({"company_id": company_id})
+    result = list(analytics_appointments_collection.aggregate(pipeline, maxTimeMS=ANALYTICS_MAX_TIME_MS))
+    total_appointments = analytics_appointments_collection.count_documents({"company_id": company_id}, maxTimeMS=ANALYTICS_MAX_TIME_MS)
     total_amount = sum(doc["total_amount"] for doc in result)
 
     return {
@@ -207,64 +234,79 @@ async def monthly_summary(company_id: str):
 async def get_available_slots(
     date_str: str = Query(..., description="Date in YYYY-MM-DD format"),
     duration_minutes: int = Query(..., description="Duration in minutes (30, 60, 120, 180)"),
-    company_id: str = Query(..., description="Company ID")
+    company_id: str = Query(..., description="Company ID"),
+    room: str = Query(None, description="Only this room; all rooms when omitted")
 ):
     """
     Returns available booking slots for a given date and duration.
     Booking window: 10:00 AM to 1:00 AM next day.
+    Each slot lists the rooms that are free for it.
     """
     # Parse date
     try:
         booking_date = datetime.strptime(date_str, "%Y-%m-%d").date()
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD.")
+    if duration_minutes <= 0:
+        raise HTTPException(status_code=400, detail="duration_minutes must be positive")
+
+    return await single_flight(
+        "available-slots",
+        (company_id, booking_date, duration_minutes, room),
+        compute_available_slots, company_id, booking_date, duration_minutes, room
+    )
+
 
-    # Booking window
+def compute_available_slots(company_id: str, booking_date: date, duration_minutes: int, room: str = None):
+    # Booking window, as slot indexes over the booking day and the next one
     start_time = time(10, 0)  # 10:00 AM
     end_time = time(1, 0)     # 1:00 AM (next day)
-    slot_delta = timedelta(minutes=duration_minutes)
-
-    # Generate all possible slots
-    slots = []
-    current_dt = datetime.combine(booking_date, start_time)
-    # End boundary: 1:00 AM next day
-    if end_time < start_time:
-        end_boundary = datetime.combine(booking_date + timedelta(days=1), end_time)
-    else:
-        end_boundary = datetime.combine(booking_date, end_time)
-
-    while current_dt + slot_delta <= end_boundary:
-        slots.append((current_dt, current_dt + slot_delta))
-        current_dt += timedelta(minutes=30)  # move in 30-min increments
-
-    # Fetch existing bookings for the day (including those that may cross midnight)
-    day_start = datetime.combine(booking_date, start_time)
-    day_end = end_boundary
-    bookings = list(appointments_collection.find({
-        "company_id": company_id,
-        "event_completed": {"$ne": "deleted"},
-        "$or": [
-            {"event_start_datetime": {"$lt": day_end, "$gte": day_start}},
-            {"event_end_datetime": {"$gt": day_start, "$lte": day_end}},
-            {"event_start_datetime": {"$lte": day_start}, "event_end_datetime": {"$gte": day_end}}
-        ]
-    }))
-    # Prepare list of (start, end) datetimes for booked slots
-    booked_ranges = [
-        (b["event_start_datetime"], b["event_end_datetime"]) for b in bookings
-    ]
+    first_slot = slot_index(start_time)
+    last_slot = slot_index(end_time) + (SLOTS_PER_DAY if end_time < start_time else 0)
+    needed = slot_count(duration_minutes)
+    day_start = datetime.combine(booking_date, time())
 
-    # Helper: check overlap
-    def overlaps(slot_start, slot_end, booked_start, booked_end):
-        return slot_start < booked_end and booked_start < slot_end
+    # Bitmaps for both days, all rooms, in one read
+    rooms, occupancy = load_occupancy(company_id, booking_date, days=2, room=room)
 
-    # Filter out slots that overlap with any booking
     available_slots = []
-    for slot_start, slot_end in slots:
-        if not any(overlaps(slot_start, slot_end, b_start, b_end) for b_start, b_end in booked_ranges):
+    index = first_slot
+    while index * SLOT_MINUTES + duration_minutes <= last_slot * SLOT_MINUTES:
+        free = free_rooms(rooms, occupancy, index, needed)
+        if free:
+            slot_start = day_start + timedelta(minutes=index * SLOT_MINUTES)
             available_slots.append({
                 "start": slot_start.isoformat(),
-                "end": slot_end.isoformat()
+                "end": (slot_start + timedelta(minutes=duration_minutes)).isoformat(),
+                "rooms": free
             })
+        index += 1  # move in 30-min increments
 
     return {"available_slots": available_slots}
+
+
+@router.get("/free-rooms")
+async def get_free_rooms(
+    date_str: str = Query(..., description="Date in YYYY-MM-DD format"),
+    start_time: str = Query(..., description="Start time in HH:MM format"),
+    duration_minutes: int = Query(SLOT_MINUTES, description="Duration in minutes"),
+    company_id: str = Query(..., description="Company ID")
+):
+    """
+    Returns the rooms free from start_time for duration_minutes on the given date.
+    """
+    try:
+        start_dt = datetime.strptime(f"{date_str} {start_time}", "%Y-%m-%d %H:%M")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date or time format. Use YYYY-MM-DD and HH:MM.")
+    if duration_minutes <= 0:
+        raise HTTPException(status_code=400, detail="duration_minutes must be positive")
+
+    needed = slot_count(duration_minutes + start_dt.minute % SLOT_MINUTES)
+    days = 1 + (slot_index(start_dt.time()) + needed - 1) // SLOTS_PER_DAY
+    rooms, occupancy = load_occupancy(company_id, start_dt.date(), days=days)
+    free = free_rooms(rooms, occupancy, slot_index(start_dt.time()), needed)
+    return {
+        "free_rooms": free,
+        "busy_rooms": [r for r in rooms if r not in free]
+    }
@@ -1,6 +1,8 @@
 from fastapi import APIRouter, HTTPException
-from models.user import UserCreate, UserLogin, PasswordReset, UserCreateCompany
+from models.user import UserCreate, UserLogin, PasswordReset, UserCreateCompany, CompanyRooms
+from models.occupancy import DEFAULT_ROOM
 from config.database import db
+from bson import ObjectId
 from utils import hash_password, verify_password
 
 router = APIRouter()
@@ -118,6 +120,29 @@ async def get_all_companies():
     return {"companies": result}
 
 
+@router.get("/rooms/{company_id}")
+async def get_company_rooms(company_id: str):
+    company = db["users"].find_one({"_id": ObjectId(company_id), "user_type": "admin"}, {"rooms": 1})
+    if not company:
+        raise HTTPException(status_code=404, detail="Company not found")
+    return {"rooms": company.get("rooms") or [DEFAULT_ROOM]}
+
+
+@router.put("/rooms/{company_id}")
+async def set_company_rooms(company_id: str, data: CompanyRooms):
+    rooms = list(dict.fromkeys(r.strip() for r in data.rooms if r.strip()))
+    if not rooms:
+        raise HTTPException(status_code=400, detail="At least one room is required")
+
+    result = db["users"].update_one(
+        {"_id": ObjectId(company_id), "user_type": "admin"},
+        {"$set": {"rooms": rooms}}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Company not found")
+    return {"message": "Rooms updated", "rooms": rooms}
+
+
 @router.get("/employees/{company_id}")
 async def get_employees_by_company(company_id: str):
     employees = db["users"].find({"company_id": company_id, "user_type": "employee"})
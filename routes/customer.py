@@ -0,0 +1,23 @@
+from fastapi import APIRouter, HTTPException, Query
+from config.database import customers_collection
+from models.customer import normalize_phone
+from schema.customer_schemas import individual_customer_serial, list_customer_serial
+
+router = APIRouter()
+
+
+@router.get("/")
+async def get_customers(company_id: str, limit: int = Query(50, le=500)):
+    customers = customers_collection.find({"company_id": company_id, "visit_count": {"$gt": 0}}).sort("last_visit", -1).limit(limit)
+    return {"customers": list_customer_serial(customers)}
+
+
+@router.get("/{phone}")
+async def get_customer(phone: str, company_id: str):
+    customer = customers_collection.find_one({
+        "company_id": company_id,
+        "phone": normalize_phone(phone)
+    })
+    if not customer:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return individual_customer_serial(customer)
@@ -0,0 +1,75 @@
+import asyncio
+from fastapi import APIRouter, Query
+from starlette.concurrency import run_in_threadpool
+from config.database import appointments_collection, spents_collection
+from routes.appointment import compute_available_slots
+from routes.payment import compute_financial_summary
+from routes.spent import serialize_doc
+from utils import single_flight
+from datetime import datetime, time, timedelta
+
+router = APIRouter()
+
+
+def todays_active_appointments(company_id: str, day_start: datetime, day_end: datetime):
+    appointments = appointments_collection.find({
+        "company_id": company_id,
+        "event_completed": {"$nin": ["deleted", "true"]},
+        "event_start_datetime": {"$lt": day_end},
+        "event_end_datetime": {"$gt": day_start}
+    }).sort("event_start_datetime", 1)
+    return [serialize_doc(a) for a in appointments]
+
+
+def todays_spents(company_id: str, day_start: datetime, day_end: datetime):
+    today = {"$gte": day_start, "$lt": day_end}
+    spents = spents_collection.find({
+        "company_id": company_id,
+        "$or": [{"bought_date": today}, {"salary_given_date": today}]
+    })
+    return [serialize_doc(s) for s in spents]
+
+
+@router.get("")
+async def dashboard(
+    company_id: str,
+    duration_minutes: int = Query(60, gt=0, description="Slot length used for the free slots"),
+    room: str = Query(None, description="Only this room's free slots; all rooms when omitted")
+):
+    """
+    Everything the staff app shows on launch, in one call: today's active
+    appointments, the free slots left today, this month's income/expense
+    totals and today's spends. The queries run concurrently; the slot and
+    summary parts share in-flight results with their own endpoints.
+    """
+    now = datetime.now()
+    today = now.date()
+    day_start = datetime.combine(today, time())
+    day_end = day_start + timedelta(days=1)
+    month_start = datetime(today.year, today.month, 1)
+    month_end = datetime(today.year + today.month // 12, today.month % 12 + 1, 1)
+
+    appointments, slots, summary, spents = await asyncio.gather(
+        run_in_threadpool(todays_active_appointments, company_id, day_start, day_end),
+        single_flight(
+            "available-slots",
+            (company_id, today, duration_minutes, room),
+            compute_available_slots, company_id, today, duration_minutes, room
+        ),
+        single_flight(
+            "financial-summary",
+            (company_id, month_start, month_end),
+            compute_financial_summary, company_id, month_start, month_end
+        ),
+        run_in_threadpool(todays_spents, company_id, day_start, day_end),
+    )
+
+    month_totals = {k: v for k, v in summary.items() if k != "monthly_summary"}
+    return {
+        "date": today.isoformat(),
+        "appointments": appointments,
+        "available_slots": [s for s in slots["available_slots"] if s["start"] >= now.isoformat()],
+        "month": {"month": today.strftime("%m-%Y"), **month_totals},
+        "spents": spents,
+        "spent_today": round(sum(float(s.get("amount") or 0) for s in spents), 2)
+    }
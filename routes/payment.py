@@ -1,20 +1,164 @@
-from fastapi import APIRouter
-from config.database import appointments_collection, spents_collection
+from fastapi import APIRouter, HTTPException, Query
+from models.payment import PaymentCreate, EmployeeSalaryUpdate
+from models.ledger import record_payment
+from config.database import (
+    payments_collection, deleted_payments_collection, employee_ledgers_collection,
+    analytics_appointments_collection, analytics_spents_collection, ANALYTICS_MAX_TIME_MS
+)
+from schema.ledger_schemas import individual_ledger_serial, list_ledger_serial
+from routes.spent import convert_date_fields, serialize_doc
+from utils import single_flight, sync_now
+from bson import ObjectId
+from datetime import datetime
+from typing import Optional
 
 router = APIRouter()
 
+
+@router.post("/")
+async def add_payment(data: PaymentCreate):
+    if data.amount <= 0:
+        raise HTTPException(status_code=400, detail="Amount must be greater than zero")
+
+    payment_dict = convert_date_fields(data.dict())
+    payment_dict["created_at"] = datetime.now()
+    payment_dict["updated_at"] = sync_now()
+
+    result = payments_collection.insert_one(payment_dict)
+    record_payment(data.company_id, data.employee_name, data.paid_date, data.amount)
+    return {"message": "Payment added successfully", "id": str(result.inserted_id)}
+
+
+@router.get("/")
+async def get_payments(company_id: str, employee_name: str = None):
+    query = {"company_id": company_id}
+    if employee_name:
+        query["employee_name"] = employee_name
+    payments = payments_collection.find(query).sort("paid_date", -1)
+    return [serialize_doc(p) for p in payments]
+
+
+@router.put("/{id}")
+async def update_payment(id: str, data: PaymentCreate):
+    if data.amount <= 0:
+        raise HTTPException(status_code=400, detail="Amount must be greater than zero")
+
+    existing = payments_collection.find_one({"_id": ObjectId(id)})
+    if not existing:
+        raise HTTPException(status_code=404, detail="Payment not found")
+
+    update_data = convert_date_fields(data.dict())
+    update_data["updated_at"] = sync_now()
+    payments_collection.update_one({"_id": ObjectId(id)}, {"$set": update_data})
+
+    record_payment(existing["company_id"], existing["employee_name"], existing["paid_date"], -existing.get("amount", 0), count=-1)
+    record_payment(data.company_id, data.employee_name, data.paid_date, data.amount)
+    return {"message": "Payment updated successfully"}
+
+
+@router.delete("/{id}")
+async def delete_payment(id: str):
+    existing = payments_collection.find_one_and_delete({"_id": ObjectId(id)})
+    if not existing:
+        raise HTTPException(status_code=404, detail="Payment not found")
+
+    # Keep a tombstone so synced devices learn about the delete
+    existing["deleted_at"] = datetime.now()
+    existing["updated_at"] = sync_now()
+    deleted_payments_collection.insert_one(existing)
+
+    record_payment(existing["company_id"], existing["employee_name"], existing["paid_date"], -existing.get("amount", 0), count=-1)
+    return {"message": "Payment deleted successfully"}
+
+
+@router.get("/ledger")
+async def get_ledgers(company_id: str):
+    ledgers = employee_ledgers_collection.find({"company_id": company_id}).sort("employee_name", 1)
+    return {"ledgers": list_ledger_serial(ledgers)}
+
+
+@router.get("/ledger/{employee_name}")
+async def get_ledger(employee_name: str, company_id: str):
+    ledger = employee_ledgers_collection.find_one({"company_id": company_id, "employee_name": employee_name})
+    if not ledger:
+        raise HTTPException(status_code=404, detail="No ledger for this employee")
+    return individual_ledger_serial(ledger)
+
+
+@router.put("/ledger/{employee_name}/salary")
+async def set_monthly_salary(employee_name: str, data: EmployeeSalaryUpdate):
+    now = datetime.now()
+    employee_ledgers_collection.update_one(
+        {"company_id": data.company_id, "employee_name": employee_name},
+        {
+            "$set": {"monthly_salary": data.monthly_salary, "updated_at": now},
+            "$setOnInsert": {"created_at": now, "total_paid": 0.0, "payment_count": 0},
+        },
+        upsert=True
+    )
+    return {"message": "Monthly salary updated"}
+
+def parse_month(value: str, field: str):
+    try:
+        return datetime.strptime(value, "%Y-%m")
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {field} month. Use YYYY-MM.")
+
+
 @router.get("/financial-summary")
-async def financial_summary(company_id: str):
-    # 1. Aggregate Appointments
-    appointment_pipeline = [
-        {"$match": {
-            "company_id": company_id,
-            "event_completed": {"$ne": "deleted"},
-            "event_start_datetime": {"$exists": True}
-        }},
-        {"$addFields": {
-            "booking_amount": {"$toDouble": {"$ifNull": ["$booking_amount", 0]}},
-            "addon_total": {
+async def financial_summary(
+    company_id: str,
+    from_month: Optional[str] = Query(None, alias="from", description="First month, YYYY-MM"),
+    to_month: Optional[str] = Query(None, alias="to", description="Last month (inclusive), YYYY-MM")
+):
+    start = parse_month(from_month, "from") if from_month else None
+    end = None
+    if to_month:
+        last = parse_month(to_month, "to")
+        end = datetime(last.year + last.month // 12, last.month % 12 + 1, 1)
+    if start and end and start >= end:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+
+    # Dashboards on several devices tend to ask at the same moment; compute once
+    return await single_flight("financial-summary", (company_id, start, end), compute_financial_summary, company_id, start, end)
+
+
+def compute_financial_summary(company_id: str, start: datetime = None, end: datetime = None):
+    """
+    Monthly income/expense rows plus totals for [start, end), computed in a
+    single pipeline: appointments and spents are projected to the same shape,
+    unioned, grouped per month and totalled by Mongo.
+    """
+    date_range = {"$ne": None}
+    if start:
+        date_range["$gte"] = start
+    if end:
+        date_range["$lt"] = end
+
+    zero = {"$literal": 0}
+    appointment_match = {
+        "company_id": company_id,
+        "event_completed": {"$ne": "deleted"},
+        "event_start_datetime": date_range
+    }
+    # A salary is dated by when it was given (falling back to bought_date), anything else by bought_date
+    spent_match = {
+        "company_id": company_id,
+        "$or": [
+            {"type": "Salary", "salary_given_date": date_range},
+            {"type": "Salary", "salary_given_date": None, "bought_date": date_range},
+            {"type": {"$ne": "Salary"}, "bought_date": date_range}
+        ]
+    }
+
+    pipeline = [
+        # 1. Appointments
+        {"$match": appointment_match},
+        {"$project": {
+            "_id": 0,
+            "date": "$event_start_datetime",
+            "booking": {"$toDouble": {"$ifNull": ["$booking_amount", 0]}},
+            "addon": {
                 "$sum": {
                     "$map": {
                         "input": {"$ifNull": ["$tags", []]},
@@ -23,120 +167,93 @@ async def financial_summary(company_id: str):
                     }
                 }
             },
-            "cake_price": {"$toDouble": {"$ifNull": ["$cake_price", 0]}}
+            "cake": {"$toDouble": {"$ifNull": ["$cake_price", 0]}},
+            "salary": zero,
+            "expense": zero
         }},
-        {"$group": {
-            "_id": {
-                "year": {"$year": "$event_start_datetime"},
-                "month": {"$month": "$event_start_datetime"}
-            },
-            "total_booking_amount": {"$sum": "$booking_amount"},
-            "total_addon_amount": {"$sum": "$addon_total"},
-            "total_spent_on_cake": {"$sum": "$cake_price"}
-        }}
-    ]
-    appointment_data = list(appointments_collection.aggregate(appointment_pipeline))
-
-    # 2. Aggregate Spents (handle null dates safely)
-    spent_pipeline = [
-        {"$match": {
-            "company_id": company_id,
-            "$or": [
-                {"salary_given_date": {"$ne": None}},
-                {"bought_date": {"$ne": None}}
+        # 2. Spents, in the same shape
+        {"$unionWith": {
+            "coll": analytics_spents_collection.name,
+            "pipeline": [
+                {"$match": spent_match},
+                {"$addFields": {"safe_amount": {"$toDouble": {"$ifNull": ["$amount", 0]}}}},
+                {"$project": {
+                    "_id": 0,
+                    "date": {"$cond": [
+                        {"$and": [{"$eq": ["$type", "Salary"]}, {"$ne": [{"$ifNull": ["$salary_given_date", None]}, None]}]},
+                        "$salary_given_date",
+                        "$bought_date"
+                    ]},
+                    "booking": zero,
+                    "addon": zero,
+                    "cake": zero,
+                    "salary": {"$cond": [{"$eq": ["$type", "Salary"]}, "$safe_amount", 0]},
+                    "expense": {"$cond": [{"$eq": ["$type", "Expense"]}, "$safe_amount", 0]}
+                }}
             ]
         }},
-        {"$addFields": {
-            "aggregation_date": {
-                "$cond": [
-                    {"$and": [{"$eq": ["$type", "Salary"]}, {"$ne": ["$salary_given_date", None]}]},
-                    "$salary_given_date",
-                    "$bought_date"
-                ]
-            },
-            "safe_amount": {"$toDouble": {"$ifNull": ["$amount", 0]}}
-        }},
+        # 3. Per month
         {"$group": {
-            "_id": {
-                "year": {"$year": "$aggregation_date"},
-                "month": {"$month": "$aggregation_date"}
-            },
-            "amount_spent_on_salary": {
-                "$sum": {"$cond": [{"$eq": ["$type", "Salary"]}, "$safe_amount", 0]}
-            },
-            "total_expense": {
-                "$sum": {"$cond": [{"$eq": ["$type", "Expense"]}, "$safe_amount", 0]}
-            }
+            "_id": {"year": {"$year": "$date"}, "month": {"$month": "$date"}},
+            "booking": {"$sum": "$booking"},
+            "addon": {"$sum": "$addon"},
+            "cake": {"$sum": "$cake"},
+            "salary": {"$sum": "$salary"},
+            "expense": {"$sum": "$expense"}
+        }},
+        {"$sort": {"_id.year": 1, "_id.month": 1}},
+        # 4. Rows and totals
+        {"$facet": {
+            "monthly_summary": [
+                {"$project": {
+                    "_id": 0,
+                    "month": {"$dateToString": {
+                        "format": "%m-%Y",
+                        "date": {"$dateFromParts": {"year": "$_id.year", "month": "$_id.month"}}
+                    }},
+                    "total_booking_amount": {"$round": ["$booking", 2]},
+                    "total_addon_amount": {"$round": ["$addon", 2]},
+                    "total_income": {"$round": [{"$add": ["$booking", "$addon"]}, 2]},
+                    "amount_spent_on_salary": {"$round": ["$salary", 2]},
+                    "total_expense": {"$round": ["$expense", 2]},
+                    "amount_spent": {"$round": [{"$add": ["$salary", "$expense"]}, 2]},
+                    "total_spent_on_cake": {"$round": ["$cake", 2]},
+                    "amount_left": {"$round": [{"$subtract": [{"$add": ["$booking", "$addon"]}, {"$add": ["$salary", "$expense"]}]}, 2]}
+                }}
+            ],
+            "totals": [
+                {"$group": {
+                    "_id": None,
+                    "booking": {"$sum": "$booking"},
+                    "addon": {"$sum": "$addon"},
+                    "cake": {"$sum": "$cake"},
+                    "salary": {"$sum": "$salary"},
+                    "expense": {"$sum": "$expense"}
+                }},
+                {"$project": {
+                    "_id": 0,
+                    "total_booking_amount": {"$round": ["$booking", 2]},
+                    "total_addon_amount": {"$round": ["$addon", 2]},
+                    "total_income": {"$round": [{"$add": ["$booking", "$addon"]}, 2]},
+                    "total_spent_on_salary": {"$round": ["$salary", 2]},
+                    "total_expense": {"$round": ["$expense", 2]},
+                    "total_spent": {"$round": [{"$add": ["$salary", "$expense"]}, 2]},
+                    "total_spent_on_cake": {"$round": ["$cake", 2]},
+                    "total_left": {"$round": [{"$subtract": [{"$add": ["$booking", "$addon"]}, {"$add": ["$salary", "$expense"]}]}, 2]}
+                }}
+            ]
         }}
     ]
-    spent_data = list(spents_collection.aggregate(spent_pipeline))
-
-    # 3. Merge monthly data
-    summary = {}
-
-    for a in appointment_data:
-        key = f"{a['_id']['month']:02d}-{a['_id']['year']}"
-        summary[key] = {
-            "total_booking_amount": a.get("total_booking_amount", 0),
-            "total_addon_amount": a.get("total_addon_amount", 0),
-            "total_spent_on_cake": a.get("total_spent_on_cake", 0),
-            "amount_spent_on_salary": 0,
-            "total_expense": 0
-        }
-
-    for s in spent_data:
-        key = f"{s['_id']['month']:02d}-{s['_id']['year']}"
-        if key not in summary:
-            summary[key] = {
-                "total_booking_amount": 0,
-                "total_addon_amount": 0,
-                "total_spent_on_cake": 0,
-                "amount_spent_on_salary": 0,
-                "total_expense": 0
-            }
-        summary[key]["amount_spent_on_salary"] += s.get("amount_spent_on_salary", 0)
-        summary[key]["total_expense"] += s.get("total_expense", 0)
-
-    # 4. Final Compilation
-    final = []
-    total_booking = total_addon = total_salary = total_expense = total_cake = 0
-
-    def sort_key(k):
-        m, y = map(int, k.split('-'))
-        return y, m
-
-    for key in sorted(summary.keys(), key=sort_key):
-        d = summary[key]
-        income = d["total_booking_amount"] + d["total_addon_amount"]
-        spent = d["amount_spent_on_salary"] + d["total_expense"]
-        left = income - spent
-
-        final.append({
-            "month": key,
-            "total_booking_amount": round(d["total_booking_amount"], 2),
-            "total_addon_amount": round(d["total_addon_amount"], 2),
-            "total_income": round(income, 2),
-            "amount_spent_on_salary": round(d["amount_spent_on_salary"], 2),
-            "total_expense": round(d["total_expense"], 2),
-            "amount_spent": round(spent, 2),
-            "total_spent_on_cake": round(d["total_spent_on_cake"], 2),
-            "amount_left": round(left, 2)
-        })
-
-        total_booking += d["total_booking_amount"]
-        total_addon += d["total_addon_amount"]
-        total_salary += d["amount_spent_on_salary"]
-        total_expense += d["total_expense"]
-        total_cake += d["total_spent_on_cake"]
-
-    return {
-        "monthly_summary": final,
-        "total_booking_amount": round(total_booking, 2),
-        "total_addon_amount": round(total_addon, 2),
-        "total_income": round(total_booking + total_addon, 2),
-        "total_spent_on_salary": round(total_salary, 2),
-        "total_expense": round(total_expense, 2),
-        "total_spent": round(total_salary + total_expense, 2),
-        "total_spent_on_cake": round(total_cake, 2),
-        "total_left": round((total_booking + total_addon) - (total_salary + total_expense), 2)
+    result = next(analytics_appointments_collection.aggregate(pipeline, maxTimeMS=ANALYTICS_MAX_TIME_MS))
+
+    totals = result["totals"][0] if result["totals"] else {
+        "total_booking_amount": 0,
+        "total_addon_amount": 0,
+        "total_income": 0,
+        "total_spent_on_salary": 0,
+        "total_expense": 0,
+        "total_spent": 0,
+        "total_spent_on_cake": 0,
+        "total_left": 0
     }
+    return {"monthly_summary": result["monthly_summary"], **totals}
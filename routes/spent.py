@@ -1,7 +1,12 @@
 from fastapi import APIRouter, HTTPException
 from models.spent import SpentCreate
-from config.database import spents_collection, payments_collection, deleted_spents_collection
+from config.database import (
+    spents_collection, deleted_spents_collection,
+    analytics_spents_collection, analytics_employee_ledgers_collection, ANALYTICS_MAX_TIME_MS
+)
+from models.ledger import claim_salary_month, move_salary
 from bson import ObjectId
+from utils import sync_now
 from datetime import datetime, date
 
 router = APIRouter()
@@ -18,15 +23,6 @@ async def add_spent(data: SpentCreate):
         if not all([data.salary_person, data.salary_month, data.salary_given_by, data.salary_payment_type]):
             raise HTTPException(status_code=400, detail="Missing salary-related fields")
 
-        existing = spents_collection.find_one({
-            "type": "Salary",
-            "salary_person": data.salary_person,
-            "company_id": data.company_id,
-            "salary_month": data.salary_month
-        })
-        if existing:
-            raise HTTPException(status_code=409, detail="Salary already given for this month")
-
     elif data.type == "Expense":
         if not all([data.item_name, data.expense_payment_type, data.expense_source]):
             raise HTTPException(status_code=400, detail="Missing expense-related fields")
@@ -36,8 +32,18 @@ async def add_spent(data: SpentCreate):
     spent_dict = data.dict()
     spent_dict = convert_date_fields(spent_dict)
     spent_dict["created_at"] = datetime.now()
-
-    spents_collection.insert_one(spent_dict)
+    spent_dict["updated_at"] = sync_now()
+
+    # Duplicate check and ledger update in one atomic write on the employee ledger
+    if data.type == "Salary" and not claim_salary_month(data.company_id, data.salary_person, data.salary_month, data.amount):
+        raise HTTPException(status_code=409, detail="Salary already given for this month")
+
+    try:
+        spents_collection.insert_one(spent_dict)
+    except Exception:
+        if data.type == "Salary":
+            move_salary(spent_dict, None)
+        raise
     return {"message": "Spent record added successfully"}
 
 def serialize_doc(doc):
@@ -58,7 +64,13 @@ async def get_spents(company_id: str):
 async def update_spent(id: str, data: SpentCreate):
     update_data = data.dict(exclude_unset=True)
     update_data = convert_date_fields(update_data)
-    update_data["updated_at"] = datetime.now()
+    update_data["updated_at"] = sync_now()
+
+    existing = spents_collection.find_one({"_id": ObjectId(id)})
+    if not existing:
+        raise HTTPException(status_code=404, detail="Spent record not found")
+    if not move_salary(existing, {**existing, **update_data}):
+        raise HTTPException(status_code=409, detail="Salary already given for this month")
 
     result = spents_collection.update_one(
         {"_id": ObjectId(id)},
@@ -82,10 +94,12 @@ async def delete_spent(id: str, reason: str):
     # Append metadata and store in deleted collection
     record["deleted_at"] = datetime.now()
     record["deleted_reason"] = reason
+    record["updated_at"] = sync_now()
     deleted_spents_collection.insert_one(record)
 
     # Remove from main collection
     spents_collection.delete_one({"_id": ObjectId(id)})
+    move_salary(record, None)
 
     return {"message": "Spent record deleted and archived"}
 
@@ -105,16 +119,15 @@ async def spent_summary(company_id: str):
             "total_spent": {"$sum": "$amount"},
         }}
     ]
-    payment_pipeline = [
-        {"$match": {"company_id": company_id}},
-        {"$group": {
-            "_id": {"month": {"$month": "$paid_date"}, "year": {"$year": "$paid_date"}},
-            "total_payment": {"$sum": "$amount"},
-        }}
-    ]
-
-    spent_summary = {f"{d['_id']['month']}-{d['_id']['year']}": d["total_spent"] for d in spents_collection.aggregate(spent_pipeline)}
-    payment_summary = {f"{d['_id']['month']}-{d['_id']['year']}": d["total_payment"] for d in payments_collection.aggregate(payment_pipeline)}
+    spent_summary = {f"{d['_id']['month']}-{d['_id']['year']}": d["total_spent"] for d in analytics_spents_collection.aggregate(spent_pipeline, maxTimeMS=ANALYTICS_MAX_TIME_MS)}
+
+    # Payments come pre-summed per month from the employee ledgers
+    payment_summary = {}
+    for ledger in analytics_employee_ledgers_collection.find({"company_id": company_id}, {"payments_by_month": 1}, max_time_ms=ANALYTICS_MAX_TIME_MS):
+        for month, amount in (ledger.get("payments_by_month") or {}).items():
+            year, _, mon = month.partition("-")
+            key = f"{int(mon)}-{year}" if mon.isdigit() else month
+            payment_summary[key] = payment_summary.get(key, 0) + amount
 
     combined = {}
     for key in set(spent_summary.keys()) | set(payment_summary.keys()):
@@ -0,0 +1,57 @@
+from fastapi import APIRouter, HTTPException, Query
+from config.database import (
+    appointments_collection, spents_collection, payments_collection,
+    deleted_spents_collection, deleted_payments_collection
+)
+from routes.spent import serialize_doc
+from utils import sync_now
+from datetime import datetime, timedelta
+
+router = APIRouter()
+
+# Writes stamped just before a sync can land just after it; re-sending this
+# much overlap is cheap and makes sure nothing falls between two tokens.
+SYNC_OVERLAP = timedelta(seconds=5)
+
+
+def encode_token(moment: datetime):
+    return str(int(moment.timestamp() * 1000))
+
+
+def decode_token(token: str):
+    try:
+        return datetime.fromtimestamp(int(token) / 1000)
+    except (TypeError, ValueError, OverflowError, OSError):
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+
+
+def _changed(collection, company_id: str, since: datetime):
+    query = {"company_id": company_id}
+    if since:
+        query["updated_at"] = {"$gte": since}
+    return [serialize_doc(doc) for doc in collection.find(query)]
+
+
+@router.get("")
+async def sync(company_id: str, since: str = Query(None, description="Token from the previous sync; omit for a full sync")):
+    """
+    Returns the appointments, spents and payments created, changed or deleted
+    since the given token, plus the token to send next time. Items may repeat
+    across consecutive syncs; clients should upsert by id.
+    """
+    since_dt = decode_token(since) if since else None
+    next_token = encode_token(sync_now() - SYNC_OVERLAP)
+
+    appointments = _changed(appointments_collection, company_id, since_dt)
+    return {
+        "appointments": [a for a in appointments if a.get("event_completed") != "deleted"],
+        "spents": _changed(spents_collection, company_id, since_dt),
+        "payments": _changed(payments_collection, company_id, since_dt),
+        "deleted": {
+            "appointments": [a for a in appointments if a.get("event_completed") == "deleted"],
+            "spents": _changed(deleted_spents_collection, company_id, since_dt),
+            "payments": _changed(deleted_payments_collection, company_id, since_dt),
+        },
+        "token": next_token,
+        "full": since_dt is None,
+    }
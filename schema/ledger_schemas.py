@@ -0,0 +1,64 @@
+from datetime import datetime
+
+
+def _month_range(first: str, last: str):
+    year, month = map(int, first.split("-"))
+    end = tuple(map(int, last.split("-")))
+    while (year, month) <= end:
+        yield f"{year}-{month:02d}"
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def _is_month(key: str):
+    try:
+        datetime.strptime(key, "%Y-%m")
+        return True
+    except ValueError:
+        return False
+
+
+def individual_ledger_serial(ledger) -> dict:
+    payments = ledger.get("payments_by_month") or {}
+    salaries = ledger.get("salary_by_month") or {}
+    monthly_salary = ledger.get("monthly_salary")
+
+    # Every month from the employee's start to now, so unpaid months show up too
+    paid_months = set(payments) | set(salaries)
+    known = sorted(m for m in paid_months if _is_month(m))
+    current = datetime.now().strftime("%Y-%m")
+    start = current
+    if ledger.get("created_at"):
+        start = min(start, ledger["created_at"].strftime("%Y-%m"))
+    if known:
+        start = min(start, known[0])
+    month_keys = list(_month_range(start, max([current] + known)))
+    month_keys += sorted(m for m in paid_months if not _is_month(m))
+
+    months = []
+    total_outstanding = 0
+    for month in month_keys:
+        paid = payments.get(month, 0) + salaries.get(month, 0)
+        outstanding = max(monthly_salary - paid, 0) if monthly_salary is not None else None
+        if outstanding:
+            total_outstanding += outstanding
+        months.append({
+            "month": month,
+            "salary_paid": round(salaries.get(month, 0), 2),
+            "payments": round(payments.get(month, 0), 2),
+            "paid": round(paid, 2),
+            "outstanding": round(outstanding, 2) if outstanding is not None else None,
+        })
+
+    return {
+        "id": str(ledger["_id"]),
+        "company_id": ledger.get("company_id"),
+        "employee_name": ledger.get("employee_name"),
+        "monthly_salary": monthly_salary,
+        "total_paid": round(ledger.get("total_paid", 0), 2),
+        "payment_count": ledger.get("payment_count", 0),
+        "total_outstanding": round(total_outstanding, 2) if monthly_salary is not None else None,
+        "months": months,
+    }
+
+def list_ledger_serial(ledgers) -> list:
+    return [individual_ledger_serial(l) for l in ledgers]
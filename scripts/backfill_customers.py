@@ -0,0 +1,32 @@
+"""
+Rebuilds the customers collection from the appointment history.
+
+Run once after deploying the customers collection, or whenever the
+stats need to be re-synced:
+
+    python -m scripts.backfill_customers
+"""
+from config.database import appointments_collection, ensure_indexes
+from models.customer import rebuild_customer_stats
+
+
+def main():
+    ensure_indexes()
+    appointments = appointments_collection.find(
+        {"event_completed": {"$ne": "deleted"}},
+        {
+            "company_id": 1,
+            "customer_name": 1,
+            "customer_phone": 1,
+            "booking_amount": 1,
+            "tags": 1,
+            "event_start_datetime": 1,
+            "event_completed": 1,
+        },
+    )
+    written = rebuild_customer_stats(appointments)
+    print(f"Customers backfilled: {written}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+"""
+Rebuilds the employee ledgers from the payments and salary spents.
+
+The API runs this once on its first startup (see run_once in
+config/database.py); run it by hand whenever the ledgers need re-syncing:
+
+    python -m scripts.backfill_ledgers
+"""
+from config.database import ensure_indexes
+from models.ledger import backfill_ledgers
+
+
+def main():
+    ensure_indexes()
+    written = backfill_ledgers()
+    print(f"Ledgers backfilled: {written}")
+
+
+if __name__ == "__main__":
+    main()
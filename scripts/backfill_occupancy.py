@@ -0,0 +1,20 @@
+"""
+Rebuilds the per-room, per-day slot bitmaps from the appointments.
+
+The API runs this once on its first startup (see run_once in
+config/database.py); run it by hand whenever the bitmaps need re-syncing:
+
+    python -m scripts.backfill_occupancy
+"""
+from config.database import ensure_indexes
+from models.occupancy import backfill_occupancy
+
+
+def main():
+    ensure_indexes()
+    written = backfill_occupancy()
+    print(f"Room-days backfilled: {written}")
+
+
+if __name__ == "__main__":
+    main()
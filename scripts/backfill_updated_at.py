@@ -0,0 +1,30 @@
+"""
+Stamps updated_at on documents written before delta sync existed, so that
+they are picked up by the (company_id, updated_at) range scans.
+
+    python -m scripts.backfill_updated_at
+"""
+from datetime import datetime
+from config.database import (
+    appointments_collection, spents_collection, payments_collection,
+    deleted_spents_collection, deleted_payments_collection, ensure_indexes
+)
+
+
+def main():
+    ensure_indexes()
+    now = datetime.now()
+    for collection in (
+        appointments_collection, spents_collection, payments_collection,
+        deleted_spents_collection, deleted_payments_collection
+    ):
+        # Best guess at the last write: deleted_at, last edit, creation, else now
+        result = collection.update_many(
+            {"updated_at": {"$exists": False}},
+            [{"$set": {"updated_at": {"$ifNull": ["$deleted_at", "$last_edited_at", "$created_at", now]}}}],
+        )
+        print(f"{collection.name}: {result.modified_count} stamped")
+
+
+if __name__ == "__main__":
+    main()
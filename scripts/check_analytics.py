@@ -0,0 +1,21 @@
+"""
+Shows which server the analytics client sends report reads to. Useful to
+confirm the routing against a local replica set, e.g.
+
+    ANALYTICS_MONGO_URI="mongodb://localhost:27017,localhost:27018/party?replicaSet=rs0" \
+    ANALYTICS_MONGO_TLS=false python -m scripts.check_analytics
+"""
+from config.database import analytics_db, analytics_client, ANALYTICS_MAX_TIME_MS
+
+
+def main():
+    hello = analytics_db.command("hello", read_preference=analytics_db.read_preference)
+    print(f"Read preference: {analytics_db.read_preference.name}")
+    print(f"Pool size:       {analytics_client.options.pool_options.max_pool_size}")
+    print(f"maxTimeMS:       {ANALYTICS_MAX_TIME_MS}")
+    print(f"Replica set:     {hello.get('setName', '-')}")
+    print(f"Served by:       {hello.get('me', '-')} ({'secondary' if hello.get('secondary') else 'primary'})")
+
+
+if __name__ == "__main__":
+    main()
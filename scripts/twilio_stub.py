@@ -0,0 +1,51 @@
+"""
+Minimal stand-in for the Twilio Messages API, for exercising the messaging
+circuit breaker without sending real messages. It can inject latency and errors:
+
+    STUB_LATENCY=3 STUB_ERROR_RATE=0.5 python -m scripts.twilio_stub 8099
+
+then run the API with TWILIO_API_BASE_URL=http://localhost:8099 (and a
+TWILIO_TIMEOUT lower than the latency to simulate timeouts).
+"""
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY = float(os.getenv("STUB_LATENCY", 0))
+ERROR_RATE = float(os.getenv("STUB_ERROR_RATE", 0))
+ERROR_STATUS = int(os.getenv("STUB_ERROR_STATUS", 503))
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if LATENCY:
+            time.sleep(LATENCY)
+
+        if random.random() < ERROR_RATE:
+            status, body = ERROR_STATUS, {"code": 20500, "message": "Injected stub error", "status": ERROR_STATUS}
+        elif not self.path.endswith("/Messages.json"):
+            status, body = 404, {"code": 20404, "message": "Not found", "status": 404}
+        else:
+            status, body = 201, {"sid": f"SM{uuid.uuid4().hex}", "status": "queued"}
+
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8099
+    print(f"Twilio stub on :{port} (latency {LATENCY}s, error rate {ERROR_RATE})")
+    ThreadingHTTPServer(("", port), StubHandler).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
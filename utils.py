@@ -1,4 +1,8 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta
 from passlib.context import CryptContext
+from starlette.concurrency import run_in_threadpool
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -6,4 +10,48 @@ def hash_password(password: str):
     return pwd_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str):
-    return pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+# In-flight computations keyed by request identity, and per-endpoint counters
+_inflight = {}
+coalesce_stats = {}
+
+async def single_flight(name: str, key: tuple, func, *args, **kwargs):
+    """
+    Runs func(*args, **kwargs) in the threadpool, unless an identical call
+    (same name + key) is already running, in which case it waits for and
+    returns that call's result instead. Callers must not mutate the result,
+    since it is shared between them.
+    """
+    stats = coalesce_stats.setdefault(name, {"executed": 0, "coalesced": 0})
+    flight_key = (name,) + tuple(key)
+    task = _inflight.get(flight_key)
+    if task is None:
+        task = asyncio.ensure_future(run_in_threadpool(func, *args, **kwargs))
+        _inflight[flight_key] = task
+        task.add_done_callback(lambda _: _inflight.pop(flight_key, None))
+        stats["executed"] += 1
+    else:
+        stats["coalesced"] += 1
+    # shield: one client disconnecting must not cancel the others' result
+    return await asyncio.shield(task)
+
+
+_last_stamp = datetime.min
+_stamp_lock = threading.Lock()
+
+def sync_now():
+    """
+    Timestamp for a document's updated_at. Never goes backwards within the
+    process, even if the wall clock does, so delta sync can't miss a write.
+    """
+    global _last_stamp
+    with _stamp_lock:
+        # Mongo keeps milliseconds, so step in whole milliseconds
+        now = datetime.now()
+        now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+        if now <= _last_stamp:
+            now = _last_stamp + timedelta(milliseconds=1)
+        _last_stamp = now
+        return now